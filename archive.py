@@ -0,0 +1,116 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from log import print_warning
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_settings = {
+    "enabled": True,
+    "path": ".cache/archive.sqlite3",
+    "hash_files": True
+}
+_connection = None
+# record_download runs in worker threads so hashing does not block the loop
+_lock = threading.Lock()
+
+def configure_archive(settings):
+    global _connection
+    if settings:
+        _settings.update(settings)
+    _connection = None
+
+def _connect():
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(_settings["path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(_settings["path"], check_same_thread=False)
+        # The primary key is the lookup index, WITHOUT ROWID keeps the rows
+        # inside it so a lookup is a single B-tree search
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            " video_id TEXT NOT NULL,"
+            " content_type TEXT NOT NULL,"
+            " format_id TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " size INTEGER,"
+            " sha256 TEXT,"
+            " completed REAL,"
+            " PRIMARY KEY (video_id, content_type, format_id)"
+            ") WITHOUT ROWID"
+        )
+        _connection.commit()
+    return _connection
+
+def is_archived(video_id, content_type):
+    if not _settings["enabled"] or not video_id:
+        return False
+    try:
+        with _lock:
+            row = _connect().execute(
+                "SELECT 1 FROM downloads WHERE video_id = ? AND content_type = ? LIMIT 1",
+                (video_id, content_type)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print_warning(f"Could not read download archive: {e}")
+        return False
+    return row is not None
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def record_download(video_id, content_type, format_id, path):
+    if not _settings["enabled"] or not video_id:
+        return
+    try:
+        size = os.path.getsize(path)
+        sha256 = file_sha256(path) if _settings["hash_files"] else None
+    except OSError:
+        size = sha256 = None
+    try:
+        with _lock:
+            connection = _connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video_id, content_type, format_id, os.path.abspath(path), size, sha256, time.time())
+            )
+            connection.commit()
+    except sqlite3.Error as e:
+        print_warning(f"Could not update download archive: {e}")
+
+def archive_entries():
+    with _lock:
+        return _connect().execute(
+            "SELECT video_id, content_type, format_id, path, size, sha256 FROM downloads"
+        ).fetchall()
+
+def verify_archive(check_hash=False):
+    # Yields (video_id, content_type, path, problem) for every entry whose
+    # file is missing or no longer matches what was recorded
+    for video_id, content_type, format_id, path, size, sha256 in archive_entries():
+        if not os.path.exists(path):
+            yield video_id, content_type, path, "missing"
+        elif size is not None and os.path.getsize(path) != size:
+            yield video_id, content_type, path, "size changed"
+        elif check_hash and sha256 and file_sha256(path) != sha256:
+            yield video_id, content_type, path, "hash mismatch"
+
+def forget_download(video_id, content_type):
+    with _lock:
+        connection = _connect()
+        connection.execute(
+            "DELETE FROM downloads WHERE video_id = ? AND content_type = ?",
+            (video_id, content_type)
+        )
+        connection.commit()
@@ -0,0 +1,170 @@
+import asyncio
+import itertools
+import os
+import re
+import signal
+import time
+
+# yt-dlp cannot change --limit-rate while it runs, so downloads are paced
+# from outside instead: every stream earns credit at its share of the
+# budget and is paused with SIGSTOP while it has spent more than it earned
+TICK = 0.2
+# Credit a stream may save up while it is below its share, in seconds
+BURST_SECONDS = 1.0
+RATE_PATTERN = re.compile(r"^\s*([\d.]+)\s*([KMG]?)i?B?\s*$", re.IGNORECASE)
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+_settings = {
+    "limit": None,
+    "schedule": []
+}
+_windows = []
+_streams = {}
+_stream_ids = itertools.count(1)
+_scheduler = None
+
+def parse_rate(value):
+    # Accepts bytes per second as a number or a string like "500K" or "2.5M"
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = RATE_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid rate: {value}")
+    return float(match.group(1)) * RATE_UNITS[match.group(2).upper()]
+
+def _minutes(text):
+    hours, minutes = text.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def configure_bandwidth(settings):
+    if settings:
+        _settings.update(settings)
+    _settings["limit"] = parse_rate(_settings["limit"])
+    _windows[:] = [
+        {'from': _minutes(window["from"]), 'to': _minutes(window["to"]), 'limit': parse_rate(window.get("limit"))}
+        for window in _settings["schedule"]
+    ]
+
+def current_limit(now=None):
+    # The first schedule window containing the local time wins; a window
+    # whose end is before its start runs past midnight
+    now = time.localtime(now)
+    minute = now.tm_hour * 60 + now.tm_min
+    for window in _windows:
+        start, end = window['from'], window['to']
+        if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+            return window['limit']
+    return _settings["limit"]
+
+def fair_shares(limit, streams):
+    # Every job gets limit * priority / total priority, split evenly
+    # between its streams (the video and audio of a merged format)
+    jobs = {}
+    for stream in streams:
+        jobs.setdefault(stream['job'], []).append(stream)
+    total = sum(job_streams[0]['priority'] for job_streams in jobs.values())
+    shares = {}
+    for job_streams in jobs.values():
+        job_share = limit * job_streams[0]['priority'] / total
+        for stream in job_streams:
+            shares[stream['id']] = job_share / len(job_streams)
+    return shares
+
+def register_stream(job, priority=1):
+    stream_id = next(_stream_ids)
+    _streams[stream_id] = {
+        'id': stream_id,
+        'job': job,
+        'priority': max(priority or 1, 0.01),
+        'process': None,
+        'active': False,
+        'last_bytes': 0,
+        'used': 0,
+        'credit': 0.0,
+        'stopped': False
+    }
+    return stream_id
+
+def attach_process(stream_id, process):
+    stream = _streams.get(stream_id)
+    if stream is not None:
+        stream['process'] = process
+        _ensure_scheduler()
+
+def update_stream(stream_id, downloaded, active=True):
+    # downloaded is the byte count from the latest progress line. It starts
+    # from zero again for every file yt-dlp fetches.
+    stream = _streams.get(stream_id)
+    if stream is None:
+        return
+    if downloaded < stream['last_bytes']:
+        stream['used'] += downloaded
+    else:
+        stream['used'] += downloaded - stream['last_bytes']
+    stream['last_bytes'] = downloaded
+    stream['active'] = active
+
+def unregister_stream(stream_id):
+    stream = _streams.pop(stream_id, None)
+    if stream is not None:
+        _signal(stream, False)
+
+def _signal(stream, stop):
+    process = stream['process']
+    if stream['stopped'] == stop or process is None or process.returncode is not None:
+        stream['stopped'] = stop
+        return
+    try:
+        process.send_signal(signal.SIGSTOP if stop else signal.SIGCONT)
+    except ProcessLookupError:
+        pass
+    stream['stopped'] = stop
+
+def limit_args():
+    # Without SIGSTOP a download gets a fixed --limit-rate for its whole
+    # run, computed from the jobs running when it starts
+    limit = current_limit()
+    if os.name != 'nt' or not limit:
+        return []
+    jobs = {stream['job'] for stream in _streams.values()}
+    return ["--limit-rate", str(int(limit / max(len(jobs), 1)))]
+
+async def schedule():
+    global _scheduler
+    last = time.monotonic()
+    try:
+        while _streams:
+            await asyncio.sleep(TICK)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+
+            limit = current_limit()
+            streams = [s for s in _streams.values() if s['process'] is not None]
+            active = [s for s in streams if s['active']]
+            if not limit or not active:
+                for stream in streams:
+                    stream['credit'] = 0.0
+                    stream['used'] = 0
+                    _signal(stream, False)
+                continue
+
+            shares = fair_shares(limit, active)
+            for stream in streams:
+                share = shares.get(stream['id'])
+                if share is None:
+                    # Idle between files or post-processing
+                    stream['used'] = 0
+                    _signal(stream, False)
+                    continue
+                stream['credit'] = min(stream['credit'] + share * elapsed - stream['used'], share * BURST_SECONDS)
+                stream['used'] = 0
+                _signal(stream, stream['credit'] < 0)
+    finally:
+        for stream in _streams.values():
+            _signal(stream, False)
+        _scheduler = None
+
+def _ensure_scheduler():
+    global _scheduler
+    if _scheduler is None and os.name != 'nt':
+        _scheduler = asyncio.ensure_future(schedule())
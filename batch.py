@@ -0,0 +1,365 @@
+import os
+import sys
+import time
+import asyncio
+from download import (
+    get_info,
+    get_best_formats,
+    fetch_content,
+    finish_content,
+    write_job_info,
+    release_info,
+    resolve_source,
+    release_source,
+    pair_audio_formats,
+    iter_playlist_entries,
+    entry_url,
+    VIDEO_EXTENSIONS,
+    AUDIO_EXTENSIONS
+)
+from selection import select_format
+from loading import add_job, remove_job, update_job
+from urls import video_id_from_url, is_playlist_url, canonical_url
+from archive import is_archived
+from sync import sync_source, commit_sync
+from storage import admit, release
+from journal import journal_job, job_key, finished_keys
+from cache import get_cached_info
+from info import CompactInfo, project_info
+from log import print_error, print_success, print_warning, record_phase, timed_phase
+
+def read_urls(source):
+    if source == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(source, 'r') as f:
+            lines = f.readlines()
+
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+async def extract_job(job, config, refresh=False):
+    info = await get_info(job['url'], refresh, project=True)
+    if not info:
+        raise RuntimeError("Failed to get information")
+
+    # run_job only gets the info back, and removes its file, once a format
+    # was chosen
+    try:
+        is_audio = job['content_type'] == "Audio"
+        extensions = AUDIO_EXTENSIONS if is_audio else VIDEO_EXTENSIONS
+        with timed_phase(info.get('id'), "select"):
+            formats = get_best_formats(info.get('formats', []), extensions, is_audio=is_audio)
+            if not formats:
+                raise RuntimeError("No suitable formats available")
+            if not is_audio and config.get("merge_audio", True):
+                pair_audio_formats(formats, info.get('formats', []))
+
+            # There is nobody to ask in batch mode, the format policy decides
+            selected = select_format(formats, config.get("format_policy"), is_audio)
+        if selected is None:
+            raise RuntimeError("No format matches the configured format policy")
+    except BaseException:
+        release_info(info)
+        raise
+
+    job['format'] = selected
+    job['format_id'] = selected['format_id']
+    return info
+
+async def download_job(job, source, config, job_id, video_id):
+    files = await fetch_content(job['url'], job['format'], config, source, job_id, video_id)
+    if files is None:
+        raise RuntimeError("Download failed")
+    return files
+
+async def postprocess_job(job, source, config, job_id, video_id, files):
+    if not await finish_content(
+            job['url'], job['format'], job['content_type'], config, source, job_id, video_id, files):
+        raise RuntimeError("Post-processing failed")
+
+def resumed_info(job):
+    # The format was chosen before the restart. The cached info is reused if
+    # it is still there, otherwise yt-dlp extracts the page itself.
+    video_id = video_id_from_url(job['url'])
+    cached = get_cached_info(video_id)
+    if cached:
+        return project_info(cached, write_job_info(cached))
+    info = CompactInfo()
+    info.id = video_id
+    info.title = job.get('title')
+    return info
+
+def set_status(job, status, **fields):
+    journal_job(job, status, **fields)
+    job['status'] = status
+
+def new_job(url, content_type):
+    return {'url': url, 'content_type': content_type, 'status': "queued", 'format_id': None, 'error': None, 'row': None}
+
+def make_slots(extract_workers=4, download_workers=2, postprocess_workers=None):
+    # ffmpeg work is CPU bound, by default one post-processing job per core.
+    # 'ahead' bounds the jobs between extraction and a download slot: stream
+    # URLs expire and every such job keeps an info file, so extraction only
+    # runs a little ahead of the downloads.
+    return {
+        'ahead': asyncio.Semaphore(extract_workers + 2 * download_workers),
+        'extract': asyncio.Semaphore(extract_workers),
+        'download': asyncio.Semaphore(download_workers),
+        'postprocess': asyncio.Semaphore(postprocess_workers or os.cpu_count() or 1)
+    }
+
+async def run_job(job, config, slots, refresh=False, force=False):
+    # Runs one job through extraction and download, bounded by slots from
+    # make_slots(). The outcome is left in job['status'] and job['error'].
+    # A job resumed from the journal already has its format and goes
+    # straight to the download
+    started = time.monotonic()
+    reservation = None
+    info = None
+    source_file = None
+    resumed = job.get('format') is not None
+    if not resumed:
+        set_status(job, "queued", force=force, source=job.get('source'))
+    if not force and is_archived(video_id_from_url(job['url']), job['content_type']):
+        # Known downloads skip extraction entirely
+        set_status(job, "skipped")
+        job['seconds'] = 0
+        return
+
+    # Only jobs holding an extraction or download slot get a dashboard
+    # row, so a long playlist does not fill the terminal
+    ahead = False
+    try:
+        await slots['ahead'].acquire()
+        ahead = True
+        if resumed:
+            info = resumed_info(job)
+        else:
+            async with slots['extract']:
+                set_status(job, "extracting")
+                job['row'] = add_job(job['url'], "extracting")
+                info = await extract_job(job, config, refresh)
+                remove_job(job['row'])
+                job['row'] = None
+            # Everything needed to resume without extracting again
+            set_status(
+                job,
+                "waiting",
+                format=job['format'],
+                title=info.get('title'),
+                download_path=config.get('download_path'),
+                filename_template=config.get('filename_template')
+            )
+        job['status'] = "waiting"
+        waiting_since = time.monotonic()
+        # Jobs are held back, without taking a download slot, until the
+        # file fits on disk
+        reservation = await admit(
+            config,
+            job['format'].get('filesize'),
+            lambda path: job.update(status="waiting for disk space")
+        )
+        job['status'] = "waiting"
+        async with slots['download']:
+            slots['ahead'].release()
+            ahead = False
+            record_phase(info.get('id'), "queue", time.monotonic() - waiting_since)
+            set_status(job, "downloading")
+            job['row'] = add_job(info.get('title') or job['url'], "starting")
+            stage_start = time.monotonic()
+            source, source_file = await resolve_source(job['url'], info)
+            files = await download_job(job, source, config, job['row'], info.get('id'))
+            job['stages'] = {'network': time.monotonic() - stage_start}
+        # The download slot is free again while ffmpeg runs
+        set_status(job, "post-processing")
+        update_job(job['row'], phase="waiting to post-process", streams={})
+        async with slots['postprocess']:
+            stage_start = time.monotonic()
+            await postprocess_job(job, source, config, job['row'], info.get('id'), files)
+            job['stages']['postprocess'] = time.monotonic() - stage_start
+    except asyncio.CancelledError:
+        set_status(job, "cancelled")
+        raise
+    except Exception as e:
+        job['error'] = str(e)
+        set_status(job, "failed", error=job['error'])
+    else:
+        set_status(job, "done")
+    finally:
+        if ahead:
+            slots['ahead'].release()
+        release(reservation)
+        release_info(info)
+        release_source(source_file)
+        remove_job(job['row'])
+        job['row'] = None
+        job['seconds'] = time.monotonic() - started
+
+async def expand_playlist(url, on_entry):
+    # Entries are handed to on_entry as soon as they are listed, so
+    # downloads start while the rest of the playlist or channel is still
+    # being enumerated
+    async for entry in iter_playlist_entries(url):
+        entry_link = entry_url(entry)
+        if entry_link:
+            on_entry(entry_link)
+
+async def list_source(url, content_type, force, on_entry, jobs, listings, sync=False):
+    # Lists a playlist or channel. The source is journaled as a job of its
+    # own and only finished once every entry was handed to on_entry, so
+    # --resume lists it again if the program stops during the listing.
+    # on_entry returns the new job, or None for a duplicate; the job is
+    # tagged with its source for the journal.
+    source = new_job(url, content_type)
+    journal_job(source, "queued", kind="playlist", force=force, sync=sync)
+
+    def queue_entry(entry_url):
+        job = on_entry(entry_url)
+        if job is not None:
+            job['source'] = job_key(source)
+
+    try:
+        if sync:
+            listings.append(await sync_source(url, content_type, queue_entry))
+        else:
+            await expand_playlist(url, queue_entry)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        source['error'] = f"Could not list playlist: {e}"
+        set_status(source, "failed", error=source['error'])
+        jobs.append(source)
+        return
+    # Lets the entries' tasks journal themselves before the source is done
+    await asyncio.sleep(0)
+    journal_job(source, "done")
+
+async def run_batch(
+        urls,
+        content_type,
+        config,
+        extract_workers=4,
+        download_workers=2,
+        refresh=False,
+        force=False,
+        postprocess_workers=None,
+        sync=False
+    ):
+    # With sync=True playlists and channels only queue the entries added
+    # since their last sync, and their cursors move once the batch is done
+    jobs = []
+    tasks = []
+    listings = []
+    queued = set()
+    slots = make_slots(extract_workers, download_workers, postprocess_workers)
+
+    def queue_job(url):
+        # A video listed by two playlists, or also given on its own, is
+        # only downloaded once
+        url = canonical_url(url)
+        if url in queued:
+            return None
+        queued.add(url)
+        job = new_job(url, content_type)
+        jobs.append(job)
+        tasks.append(asyncio.ensure_future(run_job(job, config, slots, refresh, force)))
+        return job
+
+    for url in urls:
+        if is_playlist_url(url):
+            tasks.append(asyncio.ensure_future(list_source(url, content_type, force, queue_job, jobs, listings, sync)))
+        else:
+            queue_job(url)
+
+    await wait_tasks(tasks)
+    for listing in listings:
+        commit_sync(listing, jobs)
+    return jobs
+
+async def resume_batch(
+        records,
+        config,
+        extract_workers=4,
+        download_workers=2,
+        refresh=False,
+        postprocess_workers=None
+    ):
+    # Runs the unfinished jobs of an earlier run from their journal
+    # records, with the format and output paths they were started with.
+    # Playlists whose listing did not finish are listed again; entries that
+    # already have a record are not queued twice.
+    jobs = []
+    tasks = []
+    listings = []
+    slots = make_slots(extract_workers, download_workers, postprocess_workers)
+    sources = [record for record in records if record.get('kind') == "playlist"]
+    records = [record for record in records if record.get('kind') != "playlist"]
+    queued = {record['key'] for record in records} | finished_keys()
+
+    def queue_entry(url, content_type, force):
+        job = new_job(canonical_url(url), content_type)
+        if job_key(job) in queued:
+            return None
+        queued.add(job_key(job))
+        jobs.append(job)
+        tasks.append(asyncio.ensure_future(run_job(job, config[content_type.lower()], slots, refresh, force)))
+        return job
+
+    for record in records:
+        job = new_job(record['url'], record['content_type'])
+        job['source'] = record.get('source')
+        profile = dict(config[record['content_type'].lower()])
+        if record.get('format'):
+            job['format'] = record['format']
+            job['format_id'] = record['format']['format_id']
+            job['title'] = record.get('title')
+            for key in ("download_path", "filename_template"):
+                if record.get(key):
+                    profile[key] = record[key]
+        jobs.append(job)
+        tasks.append(asyncio.ensure_future(run_job(job, profile, slots, refresh, record.get('force', False))))
+    for record in sources:
+        on_entry = lambda url, record=record: queue_entry(url, record['content_type'], record.get('force', False))
+        tasks.append(asyncio.ensure_future(list_source(
+            record['url'], record['content_type'], record.get('force', False), on_entry, jobs, listings, record.get('sync', False))))
+    await wait_tasks(tasks)
+    for listing in listings:
+        commit_sync(listing, jobs)
+    return jobs
+
+async def wait_tasks(tasks):
+    # tasks may keep growing while playlists are expanded
+    try:
+        i = 0
+        while i < len(tasks):
+            await tasks[i]
+            i += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def print_batch_summary(jobs):
+    done = [job for job in jobs if job['status'] == "done"]
+    failed = [job for job in jobs if job['status'] == "failed"]
+    skipped = [job for job in jobs if job['status'] == "skipped"]
+
+    for job in failed:
+        print_warning(f"{job['url']}: {job['error']}")
+
+    if done:
+        print_success(f"{len(done)} of {len(jobs)} downloads completed")
+        stages = [job['stages'] for job in done if 'stages' in job]
+        if stages:
+            network = sum(stage['network'] for stage in stages) / len(stages)
+            postprocess = sum(stage.get('postprocess', 0) for stage in stages) / len(stages)
+            print(f"Average per download: {network:.1f}s downloading, {postprocess:.1f}s post-processing")
+    if skipped:
+        print_warning(f"{len(skipped)} of {len(jobs)} already downloaded, skipped")
+    if failed:
+        print_error(f"{len(failed)} of {len(jobs)} downloads failed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Compares per-URL extraction latency of the two get_info backends: a
+# yt-dlp process per URL against the in-process yt_dlp worker pool. The
+# URLs point at media files served from a local HTTP server, so the
+# numbers show the backend overhead rather than network latency.
+# Needs the real yt-dlp command and the yt_dlp module.
+
+import argparse
+import asyncio
+import functools
+import http.server
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine
+from cache import configure_cache
+from download import get_info
+from extractor import configure_extractor
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve_files(directory, count):
+    for n in range(count):
+        with open(os.path.join(directory, f"video{n}.mp4"), 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(QuietHandler, directory=directory)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_backend(backend, urls, workers):
+    configure_extractor({"backend": backend, "workers": workers})
+
+    async def timed(url):
+        start = time.perf_counter()
+        info = await get_info(url, refresh=True)
+        if not info:
+            raise RuntimeError(f"{backend}: extraction failed for {url}")
+        return time.perf_counter() - start
+
+    async def run_all():
+        # Sequential first, then all URLs at once limited by the pool size
+        sequential = [await timed(url) for url in urls]
+        start = time.perf_counter()
+        for n in range(0, len(urls), workers):
+            await asyncio.gather(*(timed(url) for url in urls[n:n + workers]))
+        return sequential, time.perf_counter() - start
+
+    sequential, concurrent_seconds = engine.run(run_all())
+    samples = sorted(sequential)
+    return {
+        "first_ms": round(sequential[0] * 1000, 1),
+        "mean_ms": round(statistics.mean(samples) * 1000, 1),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+        "concurrent_urls_per_s": round(len(urls) / concurrent_seconds, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction backend benchmark")
+    parser.add_argument("--urls", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    configure_cache({"enabled": False})
+    with tempfile.TemporaryDirectory(prefix="ytd-extract-") as directory:
+        server = serve_files(directory, args.urls)
+        host, port = server.server_address
+        urls = [f"http://{host}:{port}/video{n}.mp4" for n in range(args.urls)]
+        results = {
+            "benchmark": "extraction",
+            "urls": args.urls,
+            "workers": args.workers,
+            "subprocess": run_backend("subprocess", urls, args.workers),
+            "library": run_backend("library", urls, args.workers)
+        }
+        server.shutdown()
+
+    results["speedup"] = round(results["subprocess"]["mean_ms"] / max(results["library"]["mean_ms"], 0.001), 1)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Compares the memory held by N playlist entries kept as full yt-dlp info
+# dicts against the same entries kept as projected CompactInfo records.
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from info import project_info
+from synthetic import make_info
+
+def measure(texts, keep):
+    gc.collect()
+    tracemalloc.start()
+    held = []
+    for text in texts:
+        held.append(keep(json.loads(text)))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Info dict memory benchmark")
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--formats", type=int, default=80)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = [json.dumps(make_info(n_formats=args.formats, seed=n)) for n in range(args.entries)]
+
+    dict_current, dict_peak = measure(texts, lambda info: info)
+    compact_current, compact_peak = measure(texts, project_info)
+
+    results = {
+        "benchmark": "memory",
+        "entries": args.entries,
+        "formats_per_entry": args.formats,
+        "json_bytes_per_entry": sum(len(t) for t in texts) // len(texts),
+        "dict": {"held_bytes": dict_current, "peak_bytes": dict_peak},
+        "compact": {"held_bytes": compact_current, "peak_bytes": compact_peak},
+        "held_ratio": round(dict_current / max(compact_current, 1), 1)
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Compares downloading one file over a single connection with the segmented
+# backend at several connection counts. The file is served from a local HTTP
+# server that supports ranges and, like YouTube, limits the speed of every
+# connection. Every download is checked against the served bytes.
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segmented import configure_segmented, download_file
+
+RANGE = re.compile(r"bytes=(\d+)-(\d*)")
+CHUNK = 64 * 1024
+
+def make_handler(data, rate):
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            start, end = 0, len(data) - 1
+            match = RANGE.fullmatch(self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            # Paced per connection
+            started = time.monotonic()
+            sent = 0
+            for offset in range(start, end + 1, CHUNK):
+                chunk = data[offset:min(offset + CHUNK, end + 1)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                ahead = sent / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    return RangeHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the segmented downloader against a local server")
+    parser.add_argument("--size-mb", type=float, default=32, help="size of the served file")
+    parser.add_argument("--rate-mb", type=float, default=4, help="speed of each connection in MB/s")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--segment-mb", type=float, default=2)
+    args = parser.parse_args()
+
+    data = os.urandom(int(args.size_mb * 1024 * 1024))
+    digest = hashlib.sha256(data).hexdigest()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(data, args.rate_mb * 1024 * 1024))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/stream"
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ytd-segmented-") as tmp_dir:
+        for connections in args.connections:
+            configure_segmented({"connections": connections, "segment_mb": args.segment_mb})
+            path = os.path.join(tmp_dir, f"stream-{connections}.bin")
+            start = time.perf_counter()
+            download_file(url, {}, path, len(data))
+            seconds = time.perf_counter() - start
+            with open(path, 'rb') as f:
+                ok = hashlib.sha256(f.read()).hexdigest() == digest
+            results[str(connections)] = {
+                "seconds": round(seconds, 3),
+                "mb_per_s": round(len(data) / seconds / (1024 * 1024), 2),
+                "ok": ok
+            }
+            os.remove(path)
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+    if not all(result["ok"] for result in results.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# Runs YtDownloader against the fake yt-dlp in benchmarks/bin and reports
+# get_info latency, format listing and rendering costs, and end-to-end batch
+# throughput. Results are printed as JSON; --baseline compares them with an
+# earlier run and lists the metrics that got slower.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# The stub has to shadow any real yt-dlp for the processes started below
+os.environ["PATH"] = os.path.join(BENCHMARKS_DIR, "bin") + os.pathsep + os.environ.get("PATH", "")
+
+import engine
+from archive import configure_archive
+from batch import run_batch
+from cache import configure_cache
+from download import (
+    get_info,
+    get_best_formats,
+    display_info_box,
+    get_video_info_data,
+    truncate_text,
+    VIDEO_EXTENSIONS,
+    AUDIO_EXTENSIONS
+)
+from journal import configure_journal
+from synthetic import make_info, random_id
+from tuning import configure_tuning
+
+WIDE_TITLE = "日本語のタイトル 🎵 한국어 제목 " * 4
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "samples": len(samples)
+    }
+
+def per_call(stmt, number, repeat=5):
+    # Best of several repeats, in microseconds per call
+    return round(min(timeit.repeat(stmt, number=number, repeat=repeat)) / number * 1e6, 3)
+
+def bench_get_info(rng, runs, cache_dir):
+    configure_cache({"enabled": True, "path": cache_dir})
+    urls = [f"https://www.youtube.com/watch?v={random_id(rng)}" for _ in range(runs)]
+
+    def timed(url):
+        start = time.perf_counter()
+        info = engine.run(get_info(url))
+        if not info:
+            raise RuntimeError(f"get_info failed for {url}")
+        return time.perf_counter() - start
+
+    cold = [timed(url) for url in urls]
+    warm = [timed(url) for url in urls]
+    return {"extract": summarize(cold), "cached": summarize(warm)}
+
+def bench_formats(n_formats):
+    formats = make_info(n_formats=n_formats, seed=1)['formats']
+    return {
+        "formats": n_formats,
+        "video_us": per_call(lambda: get_best_formats(formats, VIDEO_EXTENSIONS), 200),
+        "audio_us": per_call(lambda: get_best_formats(formats, AUDIO_EXTENSIONS, is_audio=True), 200)
+    }
+
+def bench_rendering():
+    info = make_info(seed=2)
+    info['title'] = WIDE_TITLE
+    info_data = get_video_info_data(info)
+
+    def render_box():
+        with contextlib.redirect_stdout(io.StringIO()):
+            display_info_box(info_data)
+
+    return {
+        "truncate_ascii_us": per_call(lambda: truncate_text("x" * 200, 60), 2000),
+        "truncate_wide_us": per_call(lambda: truncate_text(WIDE_TITLE, 60), 2000),
+        "info_box_us": per_call(render_box, 500)
+    }
+
+def bench_end_to_end(rng, jobs, concurrency_levels, work_dir):
+    results = []
+    for workers in concurrency_levels:
+        level_dir = os.path.join(work_dir, f"workers-{workers}")
+        configure_cache({"enabled": True, "path": os.path.join(level_dir, "cache")})
+        config = {
+            "download_path": os.path.join(level_dir, "downloads"),
+            "filename_template": "%(id)s.%(ext)s",
+            "embed_thumbnail": False,
+            "embed_metadata": True,
+            "merge_audio": True,
+            "format_policy": {"max_height": 1080}
+        }
+        urls = [f"https://www.youtube.com/watch?v={random_id(rng)}" for _ in range(jobs)]
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            finished = engine.run(run_batch(urls, "Video", config, workers, workers))
+        elapsed = time.perf_counter() - start
+
+        done = sum(1 for job in finished if job['status'] == "done")
+        results.append({
+            "workers": workers,
+            "jobs": jobs,
+            "done": done,
+            "seconds": round(elapsed, 3),
+            "jobs_per_min": round(done / elapsed * 60, 1)
+        })
+    return results
+
+def compare(results, baseline, threshold):
+    # Walks both result trees and reports timings that grew by more than
+    # threshold (or throughput that dropped by more than it)
+    regressions = []
+
+    def walk(current, previous, path):
+        if isinstance(current, dict) and isinstance(previous, dict):
+            for key, value in current.items():
+                if key in previous:
+                    walk(value, previous[key], f"{path}.{key}" if path else key)
+        elif isinstance(current, list) and isinstance(previous, list):
+            for n, (value, old) in enumerate(zip(current, previous)):
+                walk(value, old, f"{path}[{n}]")
+        elif isinstance(current, (int, float)) and isinstance(previous, (int, float)) and previous:
+            change = (current - previous) / previous
+            higher_is_better = path.endswith("jobs_per_min")
+            if path.endswith(("_ms", "_us", "jobs_per_min")) and (-change if higher_is_better else change) > threshold:
+                regressions.append({"metric": path, "baseline": previous, "current": current, "change": round(change, 3)})
+
+    walk(results, baseline, "")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="YtDownloader benchmark suite")
+    parser.add_argument("--info-runs", type=int, default=10,
+                        help="videos to extract for the get_info latency benchmark")
+    parser.add_argument("--formats", type=int, default=600,
+                        help="size of the synthetic format list")
+    parser.add_argument("--jobs", type=int, default=16,
+                        help="videos per end-to-end batch run")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="comma separated worker counts for the end-to-end runs")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="seconds the fake yt-dlp spends extracting")
+    parser.add_argument("--rate-mb", type=float, default=50,
+                        help="simulated download speed per stream in MB/s")
+    parser.add_argument("--size-mb", type=float, default=20,
+                        help="simulated size of each downloaded stream in MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change counted as a regression (default 0.1)")
+    args = parser.parse_args()
+
+    os.environ["YTD_FAKE_LATENCY"] = str(args.latency)
+    os.environ["YTD_FAKE_RATE"] = str(args.rate_mb * 1024 * 1024)
+    os.environ["YTD_FAKE_SIZE"] = str(int(args.size_mb * 1024 * 1024))
+    configure_archive({"enabled": False})
+    # Fake throughput must not end up in the real tuning profiles
+    configure_tuning({"enabled": False})
+    # Benchmark jobs must not show up as unfinished jobs for --resume
+    configure_journal({"enabled": False})
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="ytd-bench-") as work_dir:
+        results = {
+            "benchmark": "suite",
+            "python": sys.version.split()[0],
+            "settings": {
+                "latency_s": args.latency,
+                "rate_mb_s": args.rate_mb,
+                "size_mb": args.size_mb
+            },
+            "get_info": bench_get_info(rng, args.info_runs, os.path.join(work_dir, "info-cache")),
+            "get_best_formats": bench_formats(args.formats),
+            "rendering": bench_rendering(),
+            "end_to_end": bench_end_to_end(
+                rng,
+                args.jobs,
+                [int(n) for n in args.concurrency.split(",")],
+                work_dir
+            )
+        }
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.threshold)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if results.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
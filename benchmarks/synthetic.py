@@ -0,0 +1,88 @@
+import random
+import string
+import time
+
+VIDEO_CODECS = ["avc1.640028", "avc1.4d401f", "vp9", "vp09.00.51.08", "av01.0.08M.08"]
+AUDIO_CODECS = ["mp4a.40.2", "mp4a.40.5", "opus"]
+HEIGHTS = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+PROTOCOLS = ["https", "m3u8_native", "http_dash_segments"]
+
+def random_id(rng, length=11):
+    return ''.join(rng.choice(string.ascii_letters + string.digits + "-_") for _ in range(length))
+
+def stream_url(rng, video_id, expire):
+    # Real googlevideo URLs are around 1 KB of signed query parameters
+    signature = f"{rng.getrandbits(2800):0700x}"
+    return f"https://rr1---sn-abc.googlevideo.com/videoplayback?expire={expire}&id={video_id}&sig={signature}"
+
+def make_format(rng, video_id, index, expire, fragments=40):
+    protocol = rng.choice(PROTOCOLS)
+    is_audio = index % 4 == 0
+    fmt = {
+        'format_id': str(100 + index),
+        'format_note': "medium",
+        'protocol': protocol,
+        'url': stream_url(rng, video_id, expire),
+        'http_headers': {
+            'User-Agent': "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+            'Accept': "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            'Accept-Language': "en-us,en;q=0.5",
+            'Sec-Fetch-Mode': "navigate"
+        },
+        'filesize': rng.randint(1, 900) * 1024 * 1024 if rng.random() > 0.2 else None,
+        'filesize_approx': rng.randint(1, 900) * 1024 * 1024,
+        'tbr': rng.uniform(50, 8000)
+    }
+    if is_audio:
+        fmt.update({
+            'ext': rng.choice(["m4a", "webm"]),
+            'vcodec': "none",
+            'acodec': rng.choice(AUDIO_CODECS),
+            'abr': rng.choice([48, 64, 128, 160, 256]) + rng.random(),
+            'asr': rng.choice([44100, 48000])
+        })
+    else:
+        height = rng.choice(HEIGHTS)
+        fmt.update({
+            'ext': rng.choice(["mp4", "webm"]),
+            'vcodec': rng.choice(VIDEO_CODECS),
+            'acodec': "none" if rng.random() > 0.1 else "mp4a.40.2",
+            'height': height,
+            'width': height * 16 // 9,
+            'resolution': f"{height * 16 // 9}x{height}",
+            'fps': rng.choice([24, 30, 60])
+        })
+    if protocol != "https":
+        fmt['fragments'] = [
+            {'url': f"sq/{n}/{rng.getrandbits(160):040x}", 'duration': 5.0}
+            for n in range(fragments)
+        ]
+    return fmt
+
+def make_info(video_id=None, n_formats=80, seed=None):
+    rng = random.Random(seed)
+    video_id = video_id or random_id(rng)
+    expire = int(time.time()) + 6 * 3600
+    return {
+        'id': video_id,
+        'title': f"Synthetic video {video_id} #benchmark",
+        'channel': "Benchmark Channel",
+        'uploader': "Benchmark",
+        'duration_string': "12:34",
+        'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+        'ext': "mp4",
+        'extractor': "youtube",
+        'extractor_key': "Youtube",
+        '_version': {'version': "synthetic", 'repository': "yt-dlp/yt-dlp"},
+        'description': "lorem ipsum " * 200,
+        'tags': [f"tag{n}" for n in range(30)],
+        'thumbnails': [
+            {'url': f"https://i.ytimg.com/vi/{video_id}/{n}.jpg", 'id': str(n), 'preference': -n}
+            for n in range(40)
+        ],
+        'automatic_captions': {
+            lang: [{'ext': ext, 'url': stream_url(rng, video_id, expire)} for ext in ("json3", "srv1", "vtt")]
+            for lang in ("en", "de", "fr", "es", "ja", "ko", "pt", "ru", "it", "nl")
+        },
+        'formats': [make_format(rng, video_id, n, expire) for n in range(n_formats)]
+    }
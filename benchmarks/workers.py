@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Runs several `main.py --worker --drain` processes against one temporary
+# queue directory, kills one of them with SIGKILL while it holds jobs, and
+# checks that every queued job ends up in done/ exactly once. With --stall
+# the worker is stopped past its lease and then continued instead, so its
+# jobs are taken over while it still runs. The workers use the fake yt-dlp
+# in benchmarks/bin, so no network is needed.
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(os.path.dirname(BENCHMARKS_DIR), "main.py")
+CONFIG = os.path.join(os.path.dirname(BENCHMARKS_DIR), "config.json")
+
+def write_config(work_dir, queue_dir, lease_seconds):
+    with open(CONFIG) as f:
+        config = json.load(f)
+    for profile in ("video", "audio"):
+        config[profile]["download_path"] = os.path.join(work_dir, "downloads", profile) + os.sep
+    config["queue"].update(path=queue_dir, lease_seconds=lease_seconds, heartbeat_seconds=max(lease_seconds / 4, 0.5))
+    with open(os.path.join(work_dir, "config.json"), 'w') as f:
+        f.write(json.dumps(config, indent=2) + "\n")
+
+def queued_jobs(queue_dir, state):
+    names = [name for name in os.listdir(os.path.join(queue_dir, state)) if name.endswith(".json")]
+    records = []
+    for name in names:
+        with open(os.path.join(queue_dir, state, name)) as f:
+            records.append(json.load(f))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the shared work queue with local worker processes")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=15)
+    parser.add_argument("--kill-after", type=float, default=2.0, help="seconds before one worker is killed")
+    parser.add_argument("--stall", action="store_true", help="stop the worker past its lease instead of killing it")
+    parser.add_argument("--lease-seconds", type=float, default=4.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        PATH=os.path.join(BENCHMARKS_DIR, "bin") + os.pathsep + os.environ.get("PATH", ""),
+        YTD_FAKE_LATENCY=os.environ.get("YTD_FAKE_LATENCY", "0.2"),
+        YTD_FAKE_SIZE=os.environ.get("YTD_FAKE_SIZE", str(4 * 1024 * 1024)),
+        YTD_FAKE_RATE=os.environ.get("YTD_FAKE_RATE", str(2 * 1024 * 1024))
+    )
+    rng = random.Random(1)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789"
+    urls = [
+        "https://www.youtube.com/watch?v=" + "".join(rng.choice(alphabet) for _ in range(11))
+        for _ in range(args.jobs)
+    ]
+
+    with tempfile.TemporaryDirectory(prefix="ytd-workers-") as work_dir:
+        queue_dir = os.path.join(work_dir, "queue")
+        write_config(work_dir, queue_dir, args.lease_seconds)
+        subprocess.run(
+            [sys.executable, MAIN, "--enqueue", *urls],
+            cwd=work_dir, env=env, check=True, stdout=subprocess.DEVNULL
+        )
+
+        start = time.perf_counter()
+        workers = [
+            subprocess.Popen(
+                [sys.executable, MAIN, "--worker", "--drain"],
+                cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            for _ in range(args.workers)
+        ]
+        time.sleep(args.kill_after)
+        victim = workers[0]
+        if args.stall:
+            victim.send_signal(signal.SIGSTOP)
+            time.sleep(args.lease_seconds * 3)
+            victim.send_signal(signal.SIGCONT)
+        else:
+            victim.send_signal(signal.SIGKILL)
+            victim.wait()
+
+        deadline = time.monotonic() + args.timeout
+        for worker in workers if args.stall else workers[1:]:
+            try:
+                worker.wait(timeout=max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        seconds = time.perf_counter() - start
+
+        done = queued_jobs(queue_dir, "done")
+        done_ids = [record['id'] for record in done]
+        done_urls = sorted(record['url'] for record in done)
+        result = {
+            "workers": args.workers,
+            "jobs": args.jobs,
+            "seconds": round(seconds, 2),
+            "done": len(done),
+            "failed": len(queued_jobs(queue_dir, "failed")),
+            "pending": len(queued_jobs(queue_dir, "pending")),
+            "claimed": len(queued_jobs(queue_dir, "claimed")),
+            "reclaimed": sum(1 for record in done if record.get('attempts', 0) > 0),
+            "by_worker": {}
+        }
+        for record in done:
+            result["by_worker"][record['worker']] = result["by_worker"].get(record['worker'], 0) + 1
+        result["ok"] = (
+            len(done_ids) == len(set(done_ids)) == args.jobs
+            and done_urls == sorted(urls)
+            and result["failed"] == result["pending"] == result["claimed"] == 0
+        )
+    print(json.dumps(result, indent=2))
+    if not result["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
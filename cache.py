@@ -0,0 +1,164 @@
+import json
+import os
+import tempfile
+import time
+from urllib.parse import urlparse, parse_qs
+from locking import file_lock
+from log import print_warning
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+# Stream URLs in the info dict stop working after their ``expire`` timestamp,
+# so an entry is dropped a little before the earliest one runs out.
+EXPIRE_SAFETY_MARGIN = 300
+
+_settings = {
+    "enabled": True,
+    "path": ".cache/info",
+    "ttl": 3600,
+    "max_size_mb": 50
+}
+
+def configure_cache(settings):
+    if settings:
+        _settings.update(settings)
+
+def stream_expiry(info):
+    expiry = None
+    for fmt in info.get('formats', []):
+        query = parse_qs(urlparse(fmt.get('url', '')).query)
+        try:
+            expire = int(query['expire'][0])
+        except (KeyError, ValueError, IndexError):
+            continue
+        if expiry is None or expire < expiry:
+            expiry = expire
+    return expiry
+
+def is_expiry_fresh(expiry):
+    return expiry is None or expiry - EXPIRE_SAFETY_MARGIN > time.time()
+
+def is_info_fresh(info):
+    return is_expiry_fresh(stream_expiry(info))
+
+def entry_path(video_id):
+    return os.path.join(_settings["path"], f"{video_id}.json")
+
+def _load_index():
+    try:
+        with open(os.path.join(_settings["path"], INDEX_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {"entries": {}}
+
+def _index_lock():
+    # Held around every read-modify-write of the index, which processes
+    # sharing the cache directory would otherwise overwrite
+    return file_lock(os.path.join(_settings["path"], LOCK_FILE))
+
+def _save_index(index):
+    os.makedirs(_settings["path"], exist_ok=True)
+    path = os.path.join(_settings["path"], INDEX_FILE)
+    fd, tmp_path = tempfile.mkstemp(prefix=INDEX_FILE + ".", suffix=".tmp", dir=_settings["path"])
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _remove_entry(index, video_id):
+    index["entries"].pop(video_id, None)
+    try:
+        os.remove(entry_path(video_id))
+    except FileNotFoundError:
+        pass
+
+def _evict(index):
+    max_size = _settings["max_size_mb"] * 1024 * 1024
+    entries = index["entries"]
+    total = sum(entry["size"] for entry in entries.values())
+    # Least recently used entries go first
+    for video_id in sorted(entries, key=lambda k: entries[k]["last_access"]):
+        if total <= max_size:
+            break
+        total -= entries[video_id]["size"]
+        _remove_entry(index, video_id)
+
+def get_cached_info(video_id):
+    if not _settings["enabled"] or not video_id:
+        return None
+
+    # A cache that cannot be used counts as a miss
+    info = None
+    try:
+        with _index_lock():
+            index = _load_index()
+            entry = index["entries"].get(video_id)
+            now = time.time()
+
+            if entry and entry["expires"] > now:
+                try:
+                    with open(entry_path(video_id), 'r') as f:
+                        info = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    info = None
+
+            if info is None:
+                index["misses"] = index.get("misses", 0) + 1
+                if entry:
+                    _remove_entry(index, video_id)
+            else:
+                index["hits"] = index.get("hits", 0) + 1
+                entry["last_access"] = now
+            _save_index(index)
+    except OSError as e:
+        print_warning(f"Could not update info cache index: {e}")
+    return info
+
+def store_info(video_id, info):
+    if not _settings["enabled"] or not video_id:
+        return None
+
+    now = time.time()
+    expires = now + _settings["ttl"]
+    expiry = stream_expiry(info)
+    if expiry is not None:
+        expires = min(expires, expiry - EXPIRE_SAFETY_MARGIN)
+    if expires <= now:
+        return None
+
+    try:
+        os.makedirs(_settings["path"], exist_ok=True)
+        data = json.dumps(info)
+        with _index_lock():
+            with open(entry_path(video_id), 'w') as f:
+                f.write(data)
+
+            index = _load_index()
+            index["entries"][video_id] = {
+                "expires": expires,
+                "last_access": now,
+                "size": len(data)
+            }
+            _evict(index)
+            _save_index(index)
+    except OSError as e:
+        print_warning(f"Could not write info cache: {e}")
+        return None
+    return entry_path(video_id) if video_id in index["entries"] else None
+
+def cache_stats():
+    index = _load_index()
+    entries = index["entries"]
+    return {
+        "hits": index.get("hits", 0),
+        "misses": index.get("misses", 0),
+        "entries": len(entries),
+        "size": sum(entry["size"] for entry in entries.values())
+    }
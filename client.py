@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Thin client for a daemon started with `main.py --daemon`. It only uses
+# the standard library, so submitting a URL does not pay for loading the
+# downloader itself.
+
+import argparse
+import json
+import socket
+import sys
+
+CONFIG_FILE = "config.json"
+DEFAULT_SOCKET_PATH = ".cache/ytdownloader.sock"
+
+def default_socket_path():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            return json.load(f).get("daemon", {}).get("socket_path", DEFAULT_SOCKET_PATH)
+    except (OSError, ValueError):
+        return DEFAULT_SOCKET_PATH
+
+def request(path, message):
+    # Yields every reply line until the daemon closes the connection
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        connection.sendall((json.dumps(message) + "\n").encode())
+        with connection.makefile('r', encoding="utf-8") as replies:
+            for line in replies:
+                yield json.loads(line)
+    finally:
+        connection.close()
+
+def format_size(size):
+    return f"{size / (1024 * 1024):.1f}MB"
+
+def describe(job):
+    text = f"[{job['id']}] {job['status']:<11} {job['url']}"
+    progress = job.get('progress')
+    if progress and progress['total']:
+        text += f" {progress['downloaded'] * 100 / progress['total']:.1f}% of {format_size(progress['total'])}"
+        text += f" at {format_size(progress['speed'])}/s"
+    if job.get('error'):
+        text += f" ({job['error']})"
+    return text
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Submit downloads to a running YtDownloader daemon")
+    parser.add_argument("urls", nargs="*", help="video, playlist or channel URLs to download")
+    parser.add_argument("--audio", action="store_true", help="download audio instead of video")
+    parser.add_argument("--force", action="store_true", help="download again even if already archived")
+    parser.add_argument("--wait", action="store_true", help="stream job status until the downloads finish")
+    parser.add_argument("--status", type=int, metavar="ID", help="show the status of a job")
+    parser.add_argument("--watch", type=int, nargs="+", metavar="ID", help="stream the status of jobs")
+    parser.add_argument("--cancel", type=int, metavar="ID", help="cancel a queued or running job")
+    parser.add_argument("--list", action="store_true", help="list the jobs the daemon knows about")
+    parser.add_argument("--shutdown", action="store_true", help="stop the daemon")
+    parser.add_argument("--socket", default=None, help="daemon socket path")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    path = args.socket or default_socket_path()
+
+    if args.urls:
+        message = {'op': "submit", 'urls': args.urls, 'audio': args.audio, 'force': args.force, 'wait': args.wait}
+    elif args.watch:
+        message = {'op': "watch", 'ids': args.watch}
+    elif args.status is not None:
+        message = {'op': "status", 'id': args.status}
+    elif args.cancel is not None:
+        message = {'op': "cancel", 'id': args.cancel}
+    elif args.list:
+        message = {'op': "list"}
+    elif args.shutdown:
+        message = {'op': "shutdown"}
+    else:
+        print("Nothing to do, pass a URL or one of --status, --watch, --cancel, --list, --shutdown", file=sys.stderr)
+        sys.exit(2)
+
+    exit_code = 0
+    try:
+        for reply in request(path, message):
+            if reply.get('ok') is False:
+                print(reply.get('error'), file=sys.stderr)
+                exit_code = 1
+            elif 'ids' in reply:
+                print("Submitted job " + ", ".join(str(job_id) for job_id in reply['ids']))
+            elif 'job' in reply:
+                print(describe(reply['job']))
+            elif 'jobs' in reply:
+                for job in reply['jobs']:
+                    print(describe(job))
+            elif reply.get('done'):
+                exit_code = 1 if reply['failed'] else 0
+            elif args.shutdown:
+                print("Daemon is shutting down")
+    except OSError as e:
+        print(f"Could not reach the daemon at {path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        # The jobs keep running in the daemon
+        sys.exit(130)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 from log import print_error, print_warning
@@ -9,28 +10,115 @@ DEFAULT_CONFIG = {
         "download_path": "/sdcard/Download/YouTubeDownload/Video/",
         "filename_template": "%(title)s - %(channel)s.%(ext)s",
         "embed_thumbnail": True,
-        "embed_metadata": True
+        "embed_metadata": True,
+        "merge_audio": True,
+        "priority": 1,
+        "downloader": "yt-dlp",
+        "format_selection": "auto",
+        "format_policy": {
+            "max_height": None,
+            "prefer_codecs": [],
+            "max_filesize_mb": None,
+            "prefer_protocols": ["https", "http"]
+        }
     },
     "audio": {
         "download_path": "/sdcard/Download/YouTubeDownload/Audio/",
         "filename_template": "%(title)s - %(channel)s.%(ext)s",
         "embed_thumbnail": True,
-        "embed_metadata": True
+        "embed_metadata": True,
+        "priority": 1,
+        "downloader": "yt-dlp",
+        "format_selection": "auto",
+        "format_policy": {
+            "min_abr": None,
+            "prefer_codecs": [],
+            "max_filesize_mb": None,
+            "prefer_protocols": ["https", "http"]
+        }
+    },
+    "cache": {
+        "enabled": True,
+        "path": ".cache/info",
+        "ttl": 3600,
+        "max_size_mb": 50
+    },
+    "storage": {
+        "staging_path": None,
+        "reserve_mb": 512
+    },
+    "archive": {
+        "enabled": True,
+        "path": ".cache/archive.sqlite3",
+        "hash_files": True
+    },
+    "journal": {
+        "enabled": True,
+        "path": ".cache/journal.jsonl",
+        "compact_after": 1000
+    },
+    "batch": {
+        "extract_workers": 4,
+        "download_workers": 2,
+        "postprocess_workers": None
+    },
+    "bandwidth": {
+        "limit": None,
+        "schedule": []
+    },
+    "tuning": {
+        "enabled": True,
+        "path": ".cache/tuning.json"
+    },
+    "segmented": {
+        "connections": 8,
+        "segment_mb": 4,
+        "retries": 3
+    },
+    "sync": {
+        "path": ".cache/sync.json"
+    },
+    "extraction": {
+        "backend": "subprocess",
+        "workers": 4
+    },
+    "throttle": {
+        "rate": 2.0,
+        "burst": 4,
+        "max_concurrency": 4,
+        "retries": 4,
+        "base_delay": 5.0,
+        "max_delay": 300.0
+    },
+    "metrics": {
+        "enabled": False,
+        "events_path": ".cache/metrics/events.jsonl",
+        "textfile_path": ".cache/metrics/ytdownloader.prom"
+    },
+    "queue": {
+        "path": None,
+        "lease_seconds": 60,
+        "heartbeat_seconds": 15,
+        "max_attempts": 3
+    },
+    "daemon": {
+        "socket_path": ".cache/ytdownloader.sock",
+        "keep_finished": 500,
+        "http_port": None
     }
 }
 
 def load_config():
-    config = DEFAULT_CONFIG.copy()
+    config = copy.deepcopy(DEFAULT_CONFIG)
     
     if os.path.exists(CONFIG_FILE):
         try:
             with open(CONFIG_FILE, 'r') as f:
                 user_config = json.load(f)
                 # Deep merge for nested structure
-                if 'video' in user_config:
-                    config['video'].update(user_config['video'])
-                if 'audio' in user_config:
-                    config['audio'].update(user_config['audio'])
+                for section in config:
+                    if section in user_config:
+                        config[section].update(user_config[section])
         except json.JSONDecodeError:
             print_error(f"Error reading {CONFIG_FILE}. Using default configuration.")
             save_config(DEFAULT_CONFIG)
@@ -0,0 +1,436 @@
+import asyncio
+import hmac
+import itertools
+import json
+import os
+import secrets
+import socket
+from http import HTTPStatus
+from batch import new_job, make_slots, run_job, list_source
+from urls import is_playlist_url, canonical_url
+from loading import job_stats, total_speed
+from journal import journal_job
+from log import print_success, print_warning, render_metrics
+
+# Requests and replies are single JSON objects, one per line
+TERMINAL_STATUSES = ("done", "failed", "skipped", "cancelled")
+WATCH_INTERVAL = 0.5
+# The HTTP API only listens on the loopback interface
+HTTP_HOST = "127.0.0.1"
+MAX_REQUEST_BYTES = 1024 * 1024
+PROFILES = {"video": "Video", "audio": "Audio"}
+
+_settings = {
+    "socket_path": ".cache/ytdownloader.sock",
+    "keep_finished": 500,
+    "http_port": None
+}
+_jobs = {}
+_job_ids = itertools.count(1)
+
+def token_path():
+    # The HTTP API token sits next to the socket, readable by the user only
+    return os.path.splitext(_settings["socket_path"])[0] + ".token"
+
+def _load_token():
+    # Kept across restarts so scripts can read it once
+    path = token_path()
+    try:
+        with open(path, 'r') as f:
+            token = f.read().strip()
+        if token:
+            os.chmod(path, 0o600)
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token + "\n")
+    return token
+
+def configure_daemon(settings):
+    if settings:
+        _settings.update(settings)
+
+def job_status(job):
+    status = {
+        'id': job['id'],
+        'url': job['url'],
+        'content_type': job['content_type'],
+        'status': job['status'],
+        'format_id': job['format_id'],
+        'error': job['error']
+    }
+    if 'children' in job:
+        status['children'] = list(job['children'])
+    if job['row'] is not None:
+        status['progress'] = job_stats(job['row'])
+    return status
+
+def is_finished(job):
+    return job['status'] in TERMINAL_STATUSES and all(
+        _jobs[child]['status'] in TERMINAL_STATUSES for child in job.get('children', []) if child in _jobs
+    )
+
+def _register(url, content_type):
+    job = new_job(url, content_type)
+    job['id'] = next(_job_ids)
+    _jobs[job['id']] = job
+    return job
+
+def _prune():
+    finished = [job_id for job_id, job in _jobs.items() if is_finished(job)]
+    for job_id in finished[:max(0, len(finished) - _settings["keep_finished"])]:
+        del _jobs[job_id]
+
+async def _read_http_request(reader):
+    # Returns (method, path, headers, body) of one HTTP/1.1 request
+    request_line = (await reader.readline()).decode("latin-1").split()
+    if len(request_line) != 3:
+        raise ValueError("Malformed request line")
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_REQUEST_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return request_line[0].upper(), request_line[1], headers, body
+
+def _check_http_request(method, headers, token):
+    # Any web page the user opens can send requests to 127.0.0.1, and with
+    # DNS rebinding read the answers. Browsers always send Origin on
+    # cross-site POSTs and DELETEs and the page's own host name in Host,
+    # and cannot read the token file. Returns (status, error) to reject the
+    # request with, or None.
+    port = _settings["http_port"]
+    if headers.get("host", "").lower() not in (f"{HTTP_HOST}:{port}", f"localhost:{port}"):
+        return 403, "Host must be 127.0.0.1 or localhost"
+    if "origin" in headers:
+        return 403, "Requests from web pages are not accepted"
+    scheme, _, presented = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(presented.strip().encode(), token.encode()):
+        return 401, f"Pass the token from {token_path()} as 'Authorization: Bearer TOKEN'"
+    if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+        return 415, "Content-Type must be application/json"
+    return None
+
+async def _send_http(writer, status, body, content_type="application/json"):
+    if content_type == "application/json":
+        body = json.dumps(body) + "\n"
+    data = body.encode()
+    status = HTTPStatus(status)
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}; charset=utf-8\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        "Connection: close\r\n\r\n".encode() + data
+    )
+    await writer.drain()
+
+def live_metrics():
+    # Gauges for the running daemon, next to the phase histograms
+    counts = {}
+    for job in _jobs.values():
+        if 'children' not in job:
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+    lines = [
+        "# HELP ytdownloader_jobs Jobs the daemon knows about by status.",
+        "# TYPE ytdownloader_jobs gauge"
+    ]
+    lines += [f'ytdownloader_jobs{{status="{status}"}} {count}' for status, count in sorted(counts.items())]
+    lines += [
+        "# HELP ytdownloader_download_speed_bytes Current total download speed.",
+        "# TYPE ytdownloader_download_speed_bytes gauge",
+        f"ytdownloader_download_speed_bytes {total_speed():.0f}"
+    ]
+    return "\n".join(lines) + "\n"
+
+def _check_socket(path):
+    # A socket file left behind by a daemon that died is removed, one that
+    # still accepts connections means a daemon is already running
+    if not os.path.exists(path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+        return True
+    finally:
+        probe.close()
+    return False
+
+async def serve(
+        config,
+        extract_workers=4,
+        download_workers=2,
+        refresh=False,
+        validate_url=None,
+        postprocess_workers=None
+    ):
+    # Keeps config, caches and the engine loop warm and runs submitted
+    # jobs through the batch pipeline until a shutdown request or Ctrl-C
+    path = _settings["socket_path"]
+    if not _check_socket(path):
+        raise RuntimeError(f"A daemon is already listening on {path}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    slots = make_slots(extract_workers, download_workers, postprocess_workers)
+    tasks = set()
+    stopped = asyncio.Event()
+
+    def start(coro):
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    def queue_job(url, content_type, force, profile):
+        job = _register(canonical_url(url), content_type)
+        job['task'] = start(run_job(job, profile, slots, refresh, force))
+        return job
+
+    async def queue_playlist(job, force, profile):
+        job['status'] = "listing"
+        failed = []
+
+        def queue_entry(url):
+            child = queue_job(url, job['content_type'], force, profile)
+            job['children'].append(child['id'])
+            return child
+
+        try:
+            await list_source(
+                job['url'],
+                job['content_type'],
+                force,
+                queue_entry,
+                failed,
+                []
+            )
+        except asyncio.CancelledError:
+            job['status'] = "cancelled"
+            raise
+        if failed:
+            job['status'] = "failed"
+            job['error'] = failed[0]['error']
+        else:
+            job['status'] = "done"
+
+    def submit(request):
+        # format_policy, if given, replaces rules of the profile's policy
+        # for these jobs only
+        content_type = "Audio" if request.get('audio') else "Video"
+        force = bool(request.get('force'))
+        profile = config[content_type.lower()]
+        if request.get('format_policy'):
+            profile = dict(profile, format_policy={**profile.get('format_policy', {}), **request['format_policy']})
+        ids = []
+        for url in request.get('urls', []):
+            if validate_url is not None and not validate_url(url):
+                job = _register(url, content_type)
+                job['status'] = "failed"
+                job['error'] = "Not a valid youtube url"
+            elif is_playlist_url(url):
+                job = _register(url, content_type)
+                job['children'] = []
+                job['task'] = start(queue_playlist(job, force, profile))
+            else:
+                job = queue_job(url, content_type, force, profile)
+            ids.append(job['id'])
+        _prune()
+        return ids
+
+    def cancel(job):
+        # Returns False if the job had already finished. A cancelled job is
+        # not resumed by --resume.
+        if is_finished(job):
+            return False
+        # A playlist whose listing already finished is cancelled too once
+        # any of its entries is
+        children_cancelled = False
+        for child in job.get('children', []):
+            if child in _jobs and cancel(_jobs[child]):
+                children_cancelled = True
+        task = job.get('task')
+        if task is not None and not task.done():
+            task.cancel()
+            # Playlist jobs are journaled too, so --resume does not list
+            # them again
+            task.add_done_callback(lambda _: journal_job(job, "removed"))
+        elif job['status'] not in TERMINAL_STATUSES or children_cancelled:
+            job['status'] = "cancelled"
+        return True
+
+    async def send(writer, message):
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+    async def watch(writer, ids):
+        # Sends a job's status whenever it changed, children of a playlist
+        # included, until every watched job has finished
+        sent = {}
+        while True:
+            watched = []
+            for job_id in ids:
+                job = _jobs.get(job_id)
+                if job is not None:
+                    watched.append(job)
+                    watched.extend(_jobs[child] for child in job.get('children', []) if child in _jobs)
+            for job in watched:
+                status = job_status(job)
+                if sent.get(job['id']) != status:
+                    sent[job['id']] = status
+                    await send(writer, {'job': status})
+            if all(is_finished(job) for job in watched):
+                break
+            await asyncio.sleep(WATCH_INTERVAL)
+        statuses = [job['status'] for job in watched if 'children' not in job]
+        await send(writer, {'done': True, 'failed': statuses.count("failed")})
+
+    async def handle(reader, writer):
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                await send(writer, {'ok': False, 'error': "Invalid request"})
+                return
+
+            op = request.get('op')
+            if op == "submit":
+                ids = submit(request)
+                await send(writer, {'ok': True, 'ids': ids})
+                if request.get('wait'):
+                    await watch(writer, ids)
+            elif op == "watch":
+                await watch(writer, request.get('ids', []))
+            elif op == "status":
+                job = _jobs.get(request.get('id'))
+                if job is None:
+                    await send(writer, {'ok': False, 'error': "Unknown job"})
+                else:
+                    await send(writer, {'ok': True, 'job': job_status(job)})
+            elif op == "cancel":
+                job = _jobs.get(request.get('id'))
+                if job is None:
+                    await send(writer, {'ok': False, 'error': "Unknown job"})
+                elif not cancel(job):
+                    await send(writer, {'ok': False, 'error': "The job has already finished"})
+                else:
+                    await send(writer, {'ok': True, 'job': job_status(job)})
+            elif op == "list":
+                await send(writer, {'ok': True, 'jobs': [job_status(job) for job in _jobs.values()]})
+            elif op == "shutdown":
+                await send(writer, {'ok': True})
+                stopped.set()
+            else:
+                await send(writer, {'ok': False, 'error': f"Unknown operation: {op}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client went away, its jobs keep running
+            pass
+        finally:
+            writer.close()
+
+    def route(method, target, body):
+        # Returns (status, body, content type) for one HTTP request
+        parts = [part for part in target.split("?")[0].split("/") if part]
+        if parts == ["metrics"] and method == "GET":
+            return 200, render_metrics() + live_metrics(), "text/plain; version=0.0.4"
+        if parts == ["jobs"] and method == "GET":
+            return 200, {'jobs': [job_status(job) for job in _jobs.values()]}, "application/json"
+        if parts == ["jobs"] and method == "POST":
+            try:
+                request = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                return 400, {'error': "The body is not valid JSON"}, "application/json"
+            if not isinstance(request, dict):
+                return 400, {'error': "Expected a JSON object"}, "application/json"
+            urls = request.get('urls') or ([request['url']] if request.get('url') else [])
+            profile = str(request.get('profile', "video")).lower()
+            if not urls or not isinstance(urls, list):
+                return 400, {'error': "Pass a url or a list of urls"}, "application/json"
+            if profile not in PROFILES:
+                return 400, {'error': "profile must be video or audio"}, "application/json"
+            if not isinstance(request.get('format_policy') or {}, dict):
+                return 400, {'error': "format_policy must be an object"}, "application/json"
+            ids = submit({
+                'urls': [str(url) for url in urls],
+                'audio': profile == "audio",
+                'force': request.get('force'),
+                'format_policy': request.get('format_policy')
+            })
+            return 201, {'ids': ids}, "application/json"
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = _jobs.get(int(parts[1])) if parts[1].isdigit() else None
+            if job is None:
+                return 404, {'error': "Unknown job"}, "application/json"
+            if method == "GET":
+                return 200, job_status(job), "application/json"
+            if method == "DELETE":
+                if not cancel(job):
+                    return 409, {'error': "The job has already finished"}, "application/json"
+                return 202, job_status(job), "application/json"
+            return 405, {'error': f"{method} is not supported here"}, "application/json"
+        return 404, {'error': "Not found"}, "application/json"
+
+    async def handle_http(reader, writer):
+        try:
+            try:
+                method, target, headers, body = await _read_http_request(reader)
+            except ValueError as e:
+                await _send_http(writer, 400, {'error': str(e)})
+                return
+            rejected = _check_http_request(method, headers, token)
+            if rejected is not None:
+                await _send_http(writer, rejected[0], {'error': rejected[1]})
+                return
+            status, reply, content_type = route(method, target, body)
+            await _send_http(writer, status, reply, content_type)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # The socket has no token check, so it is created readable by the user
+    # only rather than chmodded after it is already listening
+    umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(handle, path)
+    finally:
+        os.umask(umask)
+    print_success(f"Daemon listening on {path}")
+    http_server = None
+    try:
+        if _settings["http_port"]:
+            token = _load_token()
+            try:
+                http_server = await asyncio.start_server(handle_http, HTTP_HOST, _settings["http_port"])
+            except OSError as e:
+                raise RuntimeError(f"Could not start the HTTP API on port {_settings['http_port']}: {e}")
+            print_success(f"HTTP API listening on http://{HTTP_HOST}:{_settings['http_port']}, token in {token_path()}")
+        await stopped.wait()
+    finally:
+        server.close()
+        if http_server is not None:
+            http_server.close()
+        if tasks:
+            print_warning(f"Cancelling {len(tasks)} running jobs")
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await server.wait_closed()
+        if http_server is not None:
+            await http_server.wait_closed()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
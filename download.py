@@ -1,42 +1,153 @@
-import subprocess
 import wcwidth
-from log import print_error, print_red, print_success, print_warning
+from log import print_error, print_red, print_success, print_warning, record_phase, timed_phase
 import os
 import json
-from loading import start_loading, stop_loading
+import http.client
+import tempfile
+import time
+import asyncio
+import engine
+from loading import (
+    with_loading,
+    add_job,
+    update_job,
+    remove_job,
+    progress_handler,
+    parse_progress_line,
+    PROGRESS_ARGS
+)
+from cache import (
+    get_cached_info,
+    store_info,
+    is_info_fresh,
+    is_expiry_fresh
+)
+from info import CompactInfo, project_info
+from urls import video_id_from_url
+from selection import select_format
+from archive import is_archived, record_download
+from extractor import uses_library, extract_info
+from bandwidth import register_stream, attach_process, update_stream, unregister_stream, limit_args, current_limit
+from tuning import choose_settings, record_throughput, url_host, PROBE_SECONDS, MIN_PROBE_SECONDS
+from storage import work_dir, final_dir, admit, release, publish
+from throttle import paced
+from segmented import stream_format, is_segmentable, fetch_segmented, discard, RangesNotSupported
 
 # Constants
 VIDEO_EXTENSIONS = ["webm", "mp4", "mkv", "mov"]
 AUDIO_EXTENSIONS = ["m4a", "mp3", "opus", "webm", "aac"]
 MAX_BOX_WIDTH = 80
 THUMBNAIL_EMBED_SUPPORTED_EXTENSIONS = ["mp3", "mkv", "mka", "ogg", "opus", "flac", "m4a", "mp4", "m4v", "mov"]
+# Audio containers that merge into each video container without re-encoding
+AUDIO_PAIRS = {"mp4": ["m4a"], "mov": ["m4a"], "webm": ["webm"], "mkv": AUDIO_EXTENSIONS}
+FILE_PREFIX = "[ytd-file]"
 
-def run_yt_dlp_command(command):
+async def run_yt_dlp_command(command):
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        return result.stdout, None
-    except subprocess.CalledProcessError as e:
-        return None, print_error(f"yt-dlp: {e}")
-    except Exception as e:
-        return None, print_error(e)
-
-def get_info(url):
-    command = ["yt-dlp", url, "--dump-json"]
-    
-    stdout, error = run_yt_dlp_command(command)
-    if error:
-        print_error(error)
-        return None
+        returncode, stdout, stderr = await engine.run_process(command)
+    except OSError as e:
+        return None, e
 
-    if stdout is None:
-        print_error("No output received from yt-dlp")
-        return None
+    if returncode != 0:
+        lines = stderr.strip().splitlines()
+        return None, f"yt-dlp: {lines[-1] if lines else f'exited with status {returncode}'}"
+    return stdout, None
 
+def write_job_info(info):
+    # The full info of one job, kept on disk for the downloads to load with
+    # --load-info-json. A cache entry could be evicted, or never written,
+    # before the job gets its download slot. release_info removes the file.
     try:
-        return json.loads(stdout)
-    except json.JSONDecodeError as e:
-        print_error(e)
+        fd, path = tempfile.mkstemp(prefix="ytdownloader-", suffix=".info.json")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(info, f)
+    except OSError as e:
+        print_warning(f"Could not keep the video information for the download: {e}")
         return None
+    return path
+
+def release_info(info):
+    if isinstance(info, CompactInfo) and info.info_json:
+        try:
+            os.remove(info.info_json)
+        except FileNotFoundError:
+            pass
+        info.info_json = None
+
+async def get_info(url, refresh=False, project=False):
+    # project=True returns a CompactInfo holding only the fields needed for
+    # format selection; the full dict stays on disk in a file of the job's
+    # own, see write_job_info
+    video_id = video_id_from_url(url)
+    if not refresh:
+        start_time = time.monotonic()
+        info = get_cached_info(video_id)
+        if info:
+            record_phase(video_id, "extract", time.monotonic() - start_time, source="cache")
+            return project_info(info, write_job_info(info)) if project else info
+
+    start_time = time.monotonic()
+    if uses_library():
+        info, error = await paced(url, lambda: extract_info(url), video_id)
+        if error:
+            print_error(error)
+            return None
+        size = 0
+        source = "library"
+    else:
+        command = ["yt-dlp", url, "--dump-json", "--no-playlist"]
+        stdout, error = await paced(url, lambda: run_yt_dlp_command(command), video_id)
+        if error:
+            print_error(error)
+            return None
+
+        if stdout is None:
+            print_error("No output received from yt-dlp")
+            return None
+
+        lines = stdout.strip().splitlines()
+        if len(lines) > 1:
+            print_error(f"{url} contains {len(lines)} videos, download it as a playlist")
+            return None
+
+        try:
+            info = json.loads(stdout)
+        except json.JSONDecodeError as e:
+            print_error(e)
+            return None
+        size = len(stdout)
+        source = "yt-dlp"
+
+    # Remembered so a download that reuses this info can report the saving
+    info['_extract_seconds'] = time.monotonic() - start_time
+    record_phase(info.get('id') or video_id, "extract", info['_extract_seconds'], size, source=source)
+    store_info(info.get('id') or video_id, info)
+    if project:
+        return project_info(info, write_job_info(info))
+    return info
+
+def entry_url(entry):
+    if entry.get('ie_key') == "Youtube" and entry.get('id'):
+        return f"https://www.youtube.com/watch?v={entry['id']}"
+    return entry.get('url') or entry.get('webpage_url')
+
+async def iter_playlist_entries(url, flat=True, items=None):
+    # yt-dlp prints one JSON object per entry; parse each line as it arrives
+    # so the first entries can be downloaded while the list is enumerated.
+    # items limits the listing to a --playlist-items range such as "41:".
+    command = ["yt-dlp", url, "--dump-json", "--lazy-playlist"]
+    if flat:
+        command.append("--flat-playlist")
+    if items:
+        command += ["--playlist-items", items]
+
+    async for line in engine.stream_lines(command):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            print_warning(f"Skipping unreadable playlist entry: {e}")
 
 def display_width(text):
     return sum(wcwidth.wcwidth(char) for char in str(text))
@@ -87,7 +198,7 @@ def display_info_box(info_data, title="INFORMATION"):
     print("└" + "─" * box_width + "┘")
 
 def get_video_info_data(info_dict):
-    if not isinstance(info_dict, dict) or not info_dict:
+    if not isinstance(info_dict, (dict, CompactInfo)) or not info_dict:
         return None
     
     title = info_dict.get('title', 'Unknown')
@@ -137,7 +248,8 @@ def get_best_formats(formats, extensions, is_audio=False):
             'format_id': fmt.get('format_id', ''),
             'ext': ext,
             'filesize': fmt.get('filesize') or fmt.get('filesize_approx', 0),
-            'protocol': fmt.get('protocol', '')
+            'protocol': fmt.get('protocol', ''),
+            'host': fmt.get('host') or url_host(fmt.get('url'))
         }
         
         # Add audio/video specific fields
@@ -151,7 +263,8 @@ def get_best_formats(formats, extensions, is_audio=False):
             format_info.update({
                 'resolution': fmt.get('resolution', 'unknown'),
                 'height': height,
-                'vcodec': fmt.get('vcodec', '')
+                'vcodec': fmt.get('vcodec', ''),
+                'acodec': fmt.get('acodec', 'none')
             })
         
         format_groups[key].append(format_info)
@@ -170,6 +283,26 @@ def get_best_formats(formats, extensions, is_audio=False):
     
     return available_formats
 
+def pair_audio_formats(video_formats, formats):
+    # Video-only streams get the best audio stream that merges into their
+    # container, and the combined size is what gets shown and compared
+    audio_formats = get_best_formats(formats, AUDIO_EXTENSIONS, is_audio=True)
+
+    for fmt in video_formats:
+        if fmt.get('acodec') != 'none':
+            continue
+        compatible = AUDIO_PAIRS.get(fmt['ext'], [])
+        audio = next((a for a in audio_formats if a['ext'] in compatible), None)
+        if audio is None:
+            continue
+        fmt['audio'] = audio
+        if fmt['filesize'] and audio['filesize']:
+            fmt['filesize'] += audio['filesize']
+        else:
+            fmt['filesize'] = 0
+
+    return video_formats
+
 def display_formats(formats, is_audio=False):
     if not formats:
         print_error("No suitable formats available")
@@ -185,6 +318,9 @@ def display_formats(formats, is_audio=False):
             bitrate = f"{int(fmt['abr'])}kbps" if fmt['abr'] > 0 else 'unknown'
             sample_rate = f"{fmt['asr']}Hz" if fmt['asr'] > 0 else ''
             print(f"{idx}. {bitrate} {sample_rate} [{fmt['ext'].upper()}] - {size_str} - {fmt['acodec']}")
+        elif 'audio' in fmt:
+            audio = fmt['audio']
+            print(f"{idx}. {fmt['resolution']} [{fmt['ext'].upper()}] - {size_str} - {fmt['vcodec']} + {int(audio['abr'])}kbps {audio['acodec']}")
         else:
             print(f"{idx}. {fmt['resolution']} [{fmt['ext'].upper()}] - {size_str} - {fmt['vcodec']}")
     
@@ -215,70 +351,409 @@ def get_user_choice(formats):
             print_red("Operation cancelled by user")
             return None
 
-def download_content(
+def choose_format(formats, config, is_audio=False, video_id=None):
+    if config.get("format_selection", "auto") == "interactive":
+        display_formats(formats, is_audio=is_audio)
+        choice_idx = get_user_choice(formats)
+        return None if choice_idx is None else formats[choice_idx]
+
+    with timed_phase(video_id, "select"):
+        selected = select_format(formats, config.get("format_policy"), is_audio)
+    if selected is None:
+        print_error("No format matches the configured format policy")
+    return selected
+
+async def run_download_command(command, job_id, stream="main", video_id=None, priority=1, tuning=None):
+    # yt-dlp runs quietly and reports progress as parseable lines that
+    # update the job's dashboard row; other stderr lines are kept so a
+    # failure can be explained. tuning comes from choose_settings() and is
+    # scored with the throughput of the first seconds of the transfer.
+    # Returns (ok, error, final file paths).
+    errors = []
+    files = []
+    start_time = time.monotonic()
+    transfer = {'end': None, 'bytes': 0, 'current': 0, 'probe': None}
+    postprocess_started = {}
+
+    def on_other(line):
+        if line.startswith(FILE_PREFIX):
+            files.append(line[len(FILE_PREFIX):].strip())
+        else:
+            errors.append(line)
+
+    handler = progress_handler(job_id, stream, on_other=on_other)
+
+    def on_line(line):
+        # The same progress lines time the transfer and every postprocessor
+        progress = parse_progress_line(line)
+        if progress is not None:
+            now = time.monotonic()
+            status = progress['status']
+            if status == "postprocess_started":
+                postprocess_started[progress['postprocessor']] = now
+            elif status == "postprocess_finished":
+                started = postprocess_started.pop(progress['postprocessor'], None)
+                if started is not None:
+                    record_phase(video_id, "postprocess", now - started, step=progress['postprocessor'])
+            elif not status.startswith("postprocess_"):
+                # A merged format without fetch_streams downloads its
+                # streams one after the other, each counting from zero
+                transfer['end'] = now
+                if status == "finished":
+                    transfer['bytes'] += progress['downloaded']
+                    transfer['current'] = 0
+                else:
+                    transfer['current'] = progress['downloaded']
+                update_stream(bandwidth_stream, progress['downloaded'], status == "downloading")
+
+                total = transfer['bytes'] + transfer['current']
+                if transfer['probe'] is None:
+                    transfer['probe'] = [now, total, now, total]
+                elif now - transfer['probe'][0] <= PROBE_SECONDS:
+                    transfer['probe'][2:] = [now, total]
+        handler(line)
+
+    # Every process gets its share of the bandwidth budget
+    bandwidth_stream = register_stream(job_id, priority)
+    try:
+        returncode, _, _ = await engine.run_process(
+            [*command, "--quiet", *PROGRESS_ARGS, *limit_args(), *(tuning['args'] if tuning else [])],
+            on_stdout=on_line,
+            on_stderr=on_line,
+            capture=False,
+            on_start=lambda process: attach_process(bandwidth_stream, process)
+        )
+    except OSError as e:
+        return False, str(e), files
+    finally:
+        unregister_stream(bandwidth_stream)
+
+    if transfer['end'] is not None:
+        record_phase(
+            video_id,
+            "download",
+            transfer['end'] - start_time,
+            int(transfer['bytes'] + transfer['current']),
+            stream=stream or "main",
+            ok=returncode == 0,
+            tuning=tuning['value'] if tuning else None
+        )
+    # A bandwidth budget caps the throughput, so it says nothing about
+    # the settings
+    if tuning and returncode == 0 and transfer['probe'] and current_limit() is None:
+        probe_start, start_bytes, probe_end, end_bytes = transfer['probe']
+        if probe_end - probe_start >= MIN_PROBE_SECONDS:
+            record_throughput(tuning, (end_bytes - start_bytes) / (probe_end - probe_start))
+    errors = [line for line in errors if line.strip()]
+    return returncode == 0, errors[-1] if errors else None, files
+
+async def target_filename(source, format_spec, output_template):
+    # The file name yt-dlp will write for this format. Returns (filename, error).
+    returncode, stdout, stderr = await engine.run_process(
+        ["yt-dlp", *source, "-f", format_spec, "-o", output_template, "--print", "filename"]
+    )
+    lines = (stdout or "").strip().splitlines()
+    if returncode != 0 or not lines:
+        errors = (stderr or "").strip().splitlines()
+        return None, errors[-1] if errors else None
+    return lines[-1], None
+
+async def fetch_streams(source, selected_format, output_template, job_id, video_id=None, priority=1):
+    # yt-dlp fetches the streams of a merged format one after the other.
+    # Download both at once into the part files it would use itself, so the
+    # final run finds them already downloaded and only merges.
+    audio_format = selected_format['audio']
+    filename, error = await target_filename(source, format_spec_of(selected_format), output_template)
+    if filename is None:
+        return False, error
+
+    stem = os.path.splitext(filename)[0].replace("%", "%%")
+    results = await asyncio.gather(*(
+        run_download_command(
+            ["yt-dlp", "-c", *source, "-f", fmt['format_id'], "-o", f"{stem}.f{fmt['format_id']}.%(ext)s"],
+            job_id,
+            stream,
+            video_id,
+            priority,
+            choose_settings(fmt)
+        )
+        for stream, fmt in (("video", selected_format), ("audio", audio_format))
+    ))
+    for ok, error, _ in results:
+        if not ok:
+            return False, error
+    return True, None
+
+async def fetch_segments(source, selected_format, output_template, job_id, video_id=None):
+    # The segmented backend downloads every stream over several connections
+    # to the file, or part files, yt-dlp would write, so the final run only
+    # merges. Returns False if yt-dlp has to download instead.
+    filename, error = await target_filename(source, format_spec_of(selected_format), output_template)
+    if filename is None:
+        print_warning(f"Segmented download unavailable, using yt-dlp: {error}")
+        return False
+
+    stem = os.path.splitext(filename)[0]
+    if 'audio' in selected_format:
+        streams = [
+            ("video", selected_format, f"{stem}.f{selected_format['format_id']}.{selected_format['ext']}"),
+            ("audio", selected_format['audio'], f"{stem}.f{selected_format['audio']['format_id']}.{selected_format['audio']['ext']}")
+        ]
+    else:
+        streams = [("main", selected_format, filename)]
+
+    targets = []
+    for stream, fmt, path in streams:
+        full_format = stream_format(source[1], fmt['format_id'])
+        if not is_segmentable(full_format):
+            print_warning(f"Format {fmt['format_id']} is not a plain HTTP stream, using yt-dlp")
+            return False
+        # Only an exact size from the info can be checked, not an estimate
+        targets.append((stream, full_format, path, full_format.get('filesize')))
+
+    async def fetch(stream, full_format, path, expected_size):
+        start_time = time.monotonic()
+        size = await fetch_segmented(full_format, path, job_id, stream, expected_size)
+        record_phase(video_id, "download", time.monotonic() - start_time, size, stream=stream, ok=True, backend="segmented")
+
+    # Both streams have stopped writing before yt-dlp takes over
+    results = await asyncio.gather(*(fetch(*target) for target in targets), return_exceptions=True)
+    for result in results:
+        if isinstance(result, (RangesNotSupported, OSError, http.client.HTTPException)):
+            print_warning(f"Segmented download failed, using yt-dlp: {result}")
+            for _, _, path, _ in targets:
+                discard(path)
+            return False
+        if isinstance(result, BaseException):
+            raise result
+    return True
+
+def can_reuse_info(info):
+    if isinstance(info, CompactInfo):
+        return bool(info.info_json) and is_expiry_fresh(info.expires) and os.path.exists(info.info_json)
+    return bool(info) and is_info_fresh(info)
+
+async def resolve_source(url, info):
+    # Resolved once per download, so the network and post-processing runs
+    # load the same info JSON and the embed step never goes back to the
+    # network. Only info whose stream URLs have expired costs a new, paced
+    # extraction. Returns (source args, file to remove with release_source).
+    if can_reuse_info(info):
+        if isinstance(info, CompactInfo):
+            return ["--load-info-json", info.info_json], None
+        path = write_job_info(info)
+    else:
+        fresh = await get_info(url, refresh=True)
+        path = write_job_info(fresh) if fresh else None
+    if path is None:
+        return [url], None
+    return ["--load-info-json", path], path
+
+def release_source(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def format_spec_of(selected_format):
+    format_spec = selected_format['format_id']
+    if 'audio' in selected_format:
+        format_spec += "+" + selected_format['audio']['format_id']
+    return format_spec
+
+def embed_args(config, selected_format, warn=False):
+    args = []
+    if config.get("embed_metadata", True):
+        args.append("--embed-metadata")
+
+    # Only embed thumbnail if the format supports it
+    if config.get("embed_thumbnail", True):
+        if selected_format['ext'] in THUMBNAIL_EMBED_SUPPORTED_EXTENSIONS:
+            args.append("--embed-thumbnail")
+        elif warn:
+            print_warning(f"Thumbnail embedding not supported for .{selected_format['ext']} format. Skipping.")
+    return args
+
+def output_template_of(config):
+    # Downloads are written to the staging directory if there is one and
+    # only moved to download_path once they are finished
+    filename_template = config.get("filename_template", "%(title)s.%(ext)s")
+    return os.path.join(work_dir(config), filename_template)
+
+async def fetch_content(url, selected_format, config, source, job_id, video_id):
+    # Network stage: downloads and merges the media, and fetches the
+    # thumbnail if it is going to be embedded, but leaves the ffmpeg work
+    # to finish_content so a download slot is not held while it runs.
+    # source comes from resolve_source. Returns the downloaded file paths,
+    # or None on failure.
+    priority = config.get("priority", 1)
+    format_spec = format_spec_of(selected_format)
+    output_template = output_template_of(config)
+    start_time = time.monotonic()
+
+    stream = "main"
+    if (config.get("downloader") == "segmented" and source[0] == "--load-info-json"
+            and current_limit() is None
+            and await fetch_segments(source, selected_format, output_template, job_id, video_id)):
+        # The final run below finds the files and only merges
+        stream = None
+    elif 'audio' in selected_format and source[0] == "--load-info-json":
+        # The final run below only merges the fetched parts
+        stream = None
+        ok, error = await fetch_streams(source, selected_format, output_template, job_id, video_id, priority)
+        if not ok:
+            print_error(f"Download process failed: {error}" if error else "Download process failed")
+            return None
+
+    download_command = [
+        "yt-dlp",
+        "-c",
+        *source,
+        "-f", format_spec,
+        "-o", output_template,
+        "--print", f"after_move:{FILE_PREFIX} %(filepath)s"
+    ]
+    if "--embed-thumbnail" in embed_args(config, selected_format, warn=True):
+        download_command.append("--write-thumbnail")
+
+    # Only a run that downloads anything is tuned, not a merge
+    tuning = choose_settings(selected_format) if stream else None
+    ok, error, files = await run_download_command(
+        download_command, job_id, stream, video_id, priority, tuning)
+    if not ok:
+        print_error(f"Download process failed: {error}" if error else "Download process failed")
+        return None
+
+    record_phase(video_id, "stage", time.monotonic() - start_time, step="network")
+    return files
+
+async def finish_content(url, selected_format, content_type, config, source, job_id, video_id, files):
+    # Post-processing stage: embeds metadata and the thumbnail into the file
+    # fetch_content left behind, loading the same source. yt-dlp finds the
+    # file already downloaded and only runs its postprocessors. The result
+    # is then archived.
+    format_spec = format_spec_of(selected_format)
+    args = embed_args(config, selected_format)
+    start_time = time.monotonic()
+
+    if args:
+        update_job(job_id, phase="post-processing")
+        postprocess_command = [
+            "yt-dlp",
+            *source,
+            "-f", format_spec,
+            "-o", output_template_of(config),
+            *args,
+            "--print", f"after_move:{FILE_PREFIX} %(filepath)s"
+        ]
+        ok, error, processed = await run_download_command(postprocess_command, job_id, None, video_id)
+        if not ok:
+            print_error(f"Post-processing failed: {error}" if error else "Post-processing failed")
+            return False
+        files = processed or files
+    record_phase(video_id, "stage", time.monotonic() - start_time, step="postprocess")
+
+    if files:
+        with timed_phase(video_id, "publish") as phase:
+            try:
+                # Copying to another filesystem would stall the loop
+                files = await asyncio.to_thread(publish, files, config)
+            except OSError as e:
+                print_error(f"Could not move the download to {final_dir(config)}: {e}")
+                return False
+            phase['size'] = os.path.getsize(files[-1]) if os.path.exists(files[-1]) else 0
+
+    if files:
+        update_job(job_id, phase="archiving")
+        with timed_phase(video_id, "archive") as phase:
+            # Hashing a large file would stall every other job on the loop
+            await asyncio.to_thread(record_download, video_id, content_type, format_spec, files[-1])
+            phase['size'] = os.path.getsize(files[-1]) if os.path.exists(files[-1]) else 0
+
+    print_success(f"Downloaded {content_type} to {final_dir(config)}")
+    return True
+
+async def download_content(
         url,
         selected_format,
         content_type="Video",
-        config=None
+        config=None,
+        info=None,
+        quiet=False,
+        job_id=None
     ):
     if config is None:
         print_error("Configuration not provided to download_content.")
         return False
-    
-    download_path = config.get("download_path", "/sdcard/Download/YouTubeDownload/")
-    filename_template = config.get("filename_template", "%(title)s.%(ext)s")
-    embed_thumbnail = config.get("embed_thumbnail", True)
-    embed_metadata = config.get("embed_metadata", True)
 
     # Display selection info
-    if content_type == "Audio":
-        bitrate = f"{int(selected_format['abr'])}kbps" if selected_format['abr'] > 0 else 'unknown'
-        print(f"Selected: {bitrate} - {selected_format['ext']}")
-    else:
-        print(f"Selected: {selected_format['resolution']} - {selected_format['ext']}")
-    
-    # Build download command
-    download_command = [
-        "yt-dlp",
-        "-c",
-        url,
-        "-f", selected_format['format_id'],
-        "-o", os.path.join(download_path, filename_template)
-    ]
+    if not quiet:
+        if content_type == "Audio":
+            bitrate = f"{int(selected_format['abr'])}kbps" if selected_format['abr'] > 0 else 'unknown'
+            print(f"Selected: {bitrate} - {selected_format['ext']}")
+        elif 'audio' in selected_format:
+            audio = selected_format['audio']
+            print(f"Selected: {selected_format['resolution']} - {selected_format['ext']} + {int(audio['abr'])}kbps {audio['ext']}")
+        else:
+            print(f"Selected: {selected_format['resolution']} - {selected_format['ext']}")
 
-    if embed_metadata:
-        download_command.append("--embed-metadata")
-    
-    # Only embed thumbnail if the format supports it
-    if embed_thumbnail and selected_format['ext'] in THUMBNAIL_EMBED_SUPPORTED_EXTENSIONS:
-        download_command.append("--embed-thumbnail")
-    elif embed_thumbnail and selected_format['ext'] not in THUMBNAIL_EMBED_SUPPORTED_EXTENSIONS:
-        print_warning(f"Thumbnail embedding not supported for .{selected_format['ext']} format. Skipping.")
-    
-    # Execute download
+    video_id = (info.get('id') if info else None) or video_id_from_url(url)
+    own_job = job_id is None
+    if own_job:
+        job_id = add_job((info.get('title') if info else None) or url, "starting")
+
+    reservation = None
+    source_file = None
     try:
-        result = subprocess.run(download_command, check=True)
-        if result.returncode == 0:
-            print_success(f"Downloaded {content_type} to {download_path}")
-            return True
-        else:
-            print_error("Download failed")
+        try:
+            reservation = await admit(
+                config,
+                selected_format.get('filesize'),
+                lambda path: update_job(job_id, phase=f"waiting for space in {path}")
+            )
+        except OSError as e:
+            print_error(str(e))
             return False
-    except subprocess.CalledProcessError:
-        print_error("Download process failed")
-        return False
-    except KeyboardInterrupt:
-        print_red("Download cancelled by user")
-        return False
 
-def download_video(url, config=None):
+        start_time = time.monotonic()
+        reused = can_reuse_info(info)
+        source, source_file = await resolve_source(url, info)
+        files = await fetch_content(url, selected_format, config, source, job_id, video_id)
+        if files is None:
+            return False
+        network_seconds = time.monotonic() - start_time
+        if not await finish_content(url, selected_format, content_type, config, source, job_id, video_id, files):
+            return False
+
+        if not quiet:
+            elapsed = time.monotonic() - start_time
+            stages = f"download {network_seconds:.1f}s, post-processing {elapsed - network_seconds:.1f}s"
+            if reused and info.get('_extract_seconds'):
+                print(f"Finished in {elapsed:.1f}s ({stages}; reused extracted info, saved ~{info['_extract_seconds']:.1f}s)")
+            else:
+                print(f"Finished in {elapsed:.1f}s ({stages})")
+        return True
+    finally:
+        release(reservation)
+        release_source(source_file)
+        if own_job:
+            remove_job(job_id)
+
+def download_video(url, config=None, refresh=False, force=False):
     if config is None:
         print_error("Configuration not provided to download_video.")
         return
+
+    if not force and is_archived(video_id_from_url(url), "Video"):
+        print_warning("This video was already downloaded. Use --force to download it again.")
+        return
     
-    start_loading()
-    info = get_info(url)
-    stop_loading()
+    try:
+        info = engine.run(with_loading(get_info(url, refresh)))
+    except KeyboardInterrupt:
+        print_red("Operation cancelled by user")
+        return
     
     if not info:
         print_error("Failed to get video information")
@@ -296,26 +771,37 @@ def download_video(url, config=None):
     if info_data:
         display_info_box(info_data)
     
-    display_formats(available_formats)
-    
+    if config.get("merge_audio", True):
+        pair_audio_formats(available_formats, info.get('formats', []))
+
     # Get user choice and download
-    choice_idx = get_user_choice(available_formats)
-    if choice_idx is not None:
-        download_content(
-            url,
-            available_formats[choice_idx],
-            "Video",
-            config
-        )
+    selected_format = choose_format(available_formats, config, video_id=info.get('id'))
+    if selected_format is not None:
+        try:
+            engine.run(download_content(
+                url,
+                selected_format,
+                "Video",
+                config,
+                info
+            ))
+        except KeyboardInterrupt:
+            print_red("Download cancelled by user")
 
-def download_audio(url, config=None):
+def download_audio(url, config=None, refresh=False, force=False):
     if config is None:
         print_error("Configuration not provided to download_audio.")
         return
+
+    if not force and is_archived(video_id_from_url(url), "Audio"):
+        print_warning("This audio was already downloaded. Use --force to download it again.")
+        return
     
-    start_loading()
-    info = get_info(url)
-    stop_loading()
+    try:
+        info = engine.run(with_loading(get_info(url, refresh)))
+    except KeyboardInterrupt:
+        print_red("Operation cancelled by user")
+        return
     
     if not info:
         print_error("Failed to get audio information")
@@ -333,14 +819,16 @@ def download_audio(url, config=None):
     if info_data:
         display_info_box(info_data)
     
-    display_formats(available_formats, is_audio=True)
-    
     # Get user choice and download
-    choice_idx = get_user_choice(available_formats)
-    if choice_idx is not None:
-        download_content(
-            url,
-            available_formats[choice_idx],
-            "Audio",
-            config
-        )
+    selected_format = choose_format(available_formats, config, is_audio=True, video_id=info.get('id'))
+    if selected_format is not None:
+        try:
+            engine.run(download_content(
+                url,
+                selected_format,
+                "Audio",
+                config,
+                info
+            ))
+        except KeyboardInterrupt:
+            print_red("Download cancelled by user")
@@ -0,0 +1,169 @@
+import asyncio
+import atexit
+import sys
+import threading
+from log import profiled
+
+# Raw bytes are read in chunks instead of with readline() so a single
+# multi-megabyte --dump-json line or a '\r'-terminated progress bar does not
+# hit the StreamReader line limit
+CHUNK_SIZE = 64 * 1024
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+def get_loop():
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=profiled(_loop.run_forever), name="engine", daemon=True)
+            _thread.start()
+            atexit.register(shutdown)
+    return _loop
+
+def submit(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+async def _start(coro):
+    return asyncio.ensure_future(coro)
+
+async def _wait(task):
+    return await task
+
+async def _cancel(task):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+def run(coro):
+    # Blocks the calling thread until coro finishes on the engine loop. On
+    # Ctrl-C the task is cancelled and awaited, which kills its child
+    # processes, before KeyboardInterrupt is re-raised to the caller.
+    loop = get_loop()
+    task = asyncio.run_coroutine_threadsafe(_start(coro), loop).result()
+    try:
+        return asyncio.run_coroutine_threadsafe(_wait(task), loop).result()
+    except KeyboardInterrupt:
+        asyncio.run_coroutine_threadsafe(_cancel(task), loop).result()
+        raise
+
+async def _cancel_all():
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def shutdown():
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            return
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+
+    try:
+        asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result(timeout=10)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=10)
+
+async def _pump(stream, chunks=None, on_line=None, echo=None):
+    pending = b""
+    while True:
+        data = await stream.read(CHUNK_SIZE)
+        if not data:
+            break
+        if chunks is not None:
+            chunks.append(data)
+        if echo is not None:
+            echo.buffer.write(data)
+            echo.flush()
+        if on_line is not None:
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                on_line(line.decode("utf-8", "replace").rstrip("\r"))
+    if on_line is not None and pending:
+        on_line(pending.decode("utf-8", "replace").rstrip("\r"))
+
+async def kill_process(process):
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    await process.wait()
+
+async def run_process(command, on_stdout=None, on_stderr=None, echo=False, capture=True, on_start=None):
+    # Returns (returncode, stdout, stderr). on_stdout/on_stderr are called
+    # with every decoded line as it arrives; echo copies the raw output to
+    # the terminal instead. on_start receives the process once it exists.
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    if on_start is not None:
+        on_start(process)
+    stdout_chunks = [] if capture else None
+    stderr_chunks = [] if capture else None
+
+    try:
+        await asyncio.gather(
+            _pump(process.stdout, stdout_chunks, on_stdout, sys.stdout if echo else None),
+            _pump(process.stderr, stderr_chunks, on_stderr, sys.stderr if echo else None)
+        )
+        returncode = await process.wait()
+    except BaseException:
+        await kill_process(process)
+        raise
+
+    if not capture:
+        return returncode, None, None
+    return (
+        returncode,
+        b"".join(stdout_chunks).decode("utf-8", "replace"),
+        b"".join(stderr_chunks).decode("utf-8", "replace")
+    )
+
+async def stream_lines(command):
+    # Yields stdout lines while the process is still running. Leaving the
+    # loop early (or cancelling) kills the process, so callers can stop an
+    # enumeration as soon as they have what they need.
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stderr_lines = []
+    stderr_task = asyncio.ensure_future(_pump(process.stderr, on_line=stderr_lines.append))
+
+    try:
+        pending = b""
+        while True:
+            data = await process.stdout.read(CHUNK_SIZE)
+            if not data:
+                break
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8", "replace").rstrip("\r")
+        if pending:
+            yield pending.decode("utf-8", "replace").rstrip("\r")
+
+        await stderr_task
+        returncode = await process.wait()
+        if returncode != 0:
+            errors = [line for line in stderr_lines if line.strip()]
+            detail = errors[-1] if errors else f"exited with status {returncode}"
+            raise RuntimeError(f"{command[0]}: {detail}")
+    finally:
+        stderr_task.cancel()
+        await kill_process(process)
@@ -0,0 +1,78 @@
+import asyncio
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from log import print_warning
+
+try:
+    import yt_dlp
+except ImportError:
+    yt_dlp = None
+
+# Same behaviour as `yt-dlp URL --dump-json --no-playlist`
+LIBRARY_OPTIONS = {
+    "quiet": True,
+    "no_warnings": True,
+    "noplaylist": True,
+    "skip_download": True,
+    "socket_timeout": 30
+}
+
+_settings = {
+    "backend": "subprocess",
+    "workers": 4
+}
+_executor = None
+_local = threading.local()
+
+class _QuietLogger:
+    # Errors come back as DownloadError and are reported by the caller
+    def debug(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+def configure_extractor(settings):
+    if settings:
+        _settings.update(settings)
+    if _settings["backend"] == "library" and yt_dlp is None:
+        print_warning("The yt_dlp module is not installed, extracting with the yt-dlp command instead")
+        _settings["backend"] = "subprocess"
+
+def uses_library():
+    return _settings["backend"] == "library"
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_settings["workers"], thread_name_prefix="extract")
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    return _executor
+
+def _extract(url):
+    # Every worker thread keeps its own YoutubeDL, which is not thread safe.
+    # Reusing it keeps the extractor instances and the HTTP session with
+    # its open connections alive from one URL to the next.
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        ydl = _local.ydl = yt_dlp.YoutubeDL({**LIBRARY_OPTIONS, "logger": _QuietLogger()})
+    try:
+        info = ydl.extract_info(url, download=False)
+    except yt_dlp.utils.DownloadError as e:
+        return None, f"yt-dlp: {e}"
+    if info is None:
+        return None, "yt-dlp returned no information"
+    if info.get('_type') == "playlist":
+        return None, f"{url} contains several videos, download it as a playlist"
+    return ydl.sanitize_info(info), None
+
+async def extract_info(url):
+    # Returns (info, error) like the subprocess path in download.get_info
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), _extract, url)
@@ -0,0 +1,53 @@
+from cache import stream_expiry
+from tuning import url_host
+
+# Only the fields that format selection and the information box read are
+# kept; captions, thumbnails, fragment lists and stream URLs are dropped.
+FORMAT_FIELDS = (
+    "format_id", "ext", "vcodec", "acodec", "abr", "asr", "height",
+    "resolution", "filesize", "filesize_approx", "protocol", "tbr"
+)
+INFO_FIELDS = (
+    "id", "title", "channel", "uploader", "duration_string",
+    "webpage_url", "_version", "_extract_seconds"
+)
+
+class FormatRecord:
+    # host is derived from the stream URL for the download tuning profile
+    __slots__ = FORMAT_FIELDS + ("host",)
+
+    # Same lookup as dict.get, so get_best_formats works on either
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+class CompactInfo:
+    __slots__ = INFO_FIELDS + ("formats", "expires", "info_json")
+
+    def __init__(self):
+        self.formats = []
+        self.expires = None
+        self.info_json = None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+def project_format(fmt):
+    record = FormatRecord()
+    for field in FORMAT_FIELDS:
+        value = fmt.get(field)
+        if value is not None:
+            setattr(record, field, value)
+    record.host = url_host(fmt.get('url'))
+    return record
+
+def project_info(info, info_json=None):
+    compact = CompactInfo()
+    for field in INFO_FIELDS:
+        value = info.get(field)
+        if value is not None:
+            setattr(compact, field, value)
+
+    compact.formats = [project_format(fmt) for fmt in info.get("formats", [])]
+    compact.expires = stream_expiry(info)
+    compact.info_json = info_json
+    return compact
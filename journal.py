@@ -0,0 +1,163 @@
+import json
+import os
+from locking import file_lock, hold_lock, is_held
+from log import print_warning
+
+# Jobs in these states need nothing more; every other state is resumed.
+# A cancelled job was interrupted, so it is resumed too, unless it was
+# removed on purpose.
+FINISHED_STATUSES = ("done", "failed", "skipped", "removed")
+# Batch runs, sync runs and the daemon may share one journal. Every record
+# names the process that wrote it, and every writing process holds the lock
+# file <path>.owners/<pid>.lock, so jobs of a process that is still running
+# are not resumed by another one. A lock, unlike a bare pid, is not
+# mistaken for a live owner when the pid is reused after a reboot.
+
+_settings = {
+    "enabled": True,
+    "path": ".cache/journal.jsonl",
+    "compact_after": 1000
+}
+# Latest state of every job by key, and lines written since compaction
+_latest = None
+_appended = 0
+_owner_lock = None
+
+def configure_journal(settings):
+    global _latest
+    if settings:
+        _settings.update(settings)
+    _latest = None
+
+def job_key(job):
+    return f"{job['content_type']}:{job['url']}"
+
+def _lock():
+    return file_lock(_settings["path"] + ".lock")
+
+def _owner_path(pid):
+    return os.path.join(_settings["path"] + ".owners", f"{pid}.lock")
+
+def _claim_owner():
+    global _owner_lock
+    if _owner_lock is None:
+        _owner_lock = hold_lock(_owner_path(os.getpid())) or False
+
+def _owner_alive(pid):
+    return bool(pid) and pid != os.getpid() and is_held(_owner_path(pid))
+
+def _remove_dead_owners():
+    # Called under the journal lock, which a new owner also holds while it
+    # creates its lock file
+    directory = _settings["path"] + ".owners"
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        pid = name.partition(".")[0]
+        if pid.isdigit() and not _owner_alive(int(pid)) and int(pid) != os.getpid():
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+def _load(reload=False):
+    # Replays the journal. A line cut short by a crash is the last one
+    # written and is skipped. Another process may have appended since the
+    # last replay, so reload=True reads the file again.
+    global _latest
+    if _latest is not None and not reload:
+        return _latest
+    _latest = {}
+    try:
+        with open(_settings["path"], 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                _apply(record)
+    except OSError:
+        pass
+    return _latest
+
+def _apply(record):
+    key = record['key']
+    if record.get('status') == "queued" or key not in _latest:
+        # Queueing a job again starts it over
+        _latest[key] = dict(record)
+    else:
+        _latest[key].update(record)
+
+def compact():
+    # Rewrites the journal with one line per unfinished job. The file is
+    # read again under the lock, so lines other processes appended are kept.
+    global _appended
+    if not _settings["enabled"]:
+        return
+    try:
+        with _lock():
+            latest = _load(reload=True)
+            # Finished entries of a playlist that is still being listed are
+            # kept, so listing it again does not queue them a second time
+            listing = {key for key, record in latest.items() if record.get('status') not in FINISHED_STATUSES}
+            for key in [
+                key for key, record in latest.items()
+                if record.get('status') in FINISHED_STATUSES and record.get('source') not in listing
+            ]:
+                del latest[key]
+            tmp_path = _settings["path"] + ".tmp"
+            with open(tmp_path, 'w') as f:
+                for record in latest.values():
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, _settings["path"])
+            _remove_dead_owners()
+        _appended = 0
+    except OSError as e:
+        print_warning(f"Could not compact the job journal: {e}")
+
+def journal_job(job, status, **fields):
+    # Written, and synced to disk, before job takes the new status, so
+    # after a crash the journal never claims more progress than was made
+    global _appended
+    if not _settings["enabled"]:
+        return
+    record = {'key': job_key(job), 'status': status, 'owner': os.getpid(), **fields}
+    if status == "queued":
+        record.update(url=job['url'], content_type=job['content_type'])
+    _load()
+    _apply(record)
+    try:
+        with _lock():
+            _claim_owner()
+            with open(_settings["path"], 'a') as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+    except OSError as e:
+        print_warning(f"Could not write the job journal: {e}")
+        return
+    _appended += 1
+    if _appended >= _settings["compact_after"]:
+        compact()
+
+def unfinished_jobs():
+    # Jobs an earlier run queued but did not finish, oldest first. Jobs of
+    # a process that is still running, such as the daemon, are its own.
+    if not _settings["enabled"]:
+        return []
+    compact()
+    return [
+        dict(record) for record in _load().values()
+        if 'url' in record and record.get('status') not in FINISHED_STATUSES
+        and not _owner_alive(record.get('owner'))
+    ]
+
+def finished_keys():
+    # Entries of unfinished playlists that need nothing more
+    if not _settings["enabled"]:
+        return set()
+    return {key for key, record in _load().items() if record.get('status') in FINISHED_STATUSES}
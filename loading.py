@@ -1,58 +1,240 @@
 import sys
-import time
-import threading
 import os
+import time
+import shutil
+import asyncio
+import itertools
+from bandwidth import current_limit
+
+# Redraws are capped at this rate no matter how often progress lines arrive
+MAX_REFRESH_RATE = 4
+
+# yt-dlp prints these machine-readable lines instead of its progress bar
+PROGRESS_PREFIX = "[ytd-progress]"
+POSTPROCESS_PREFIX = "[ytd-postprocess]"
+PROGRESS_ARGS = [
+    "--progress",
+    "--newline",
+    "--progress-template",
+    f"download:{PROGRESS_PREFIX} %(progress.status)s %(progress.downloaded_bytes)s "
+    "%(progress.total_bytes)s %(progress.total_bytes_estimate)s %(progress.speed)s %(progress.eta)s",
+    "--progress-template",
+    f"postprocess:{POSTPROCESS_PREFIX} %(progress.status)s %(progress.postprocessor)s"
+]
 
-stop_event = threading.Event()
-loading_thread = None
+SPINNER_CHARS = ['    ', '.   ', '..  ', '... ', '....']
+
+_jobs = {}
+_job_ids = itertools.count(1)
+_renderer = None
+_drawn_lines = 0
+_dirty = True
 
 def hide_cursor():
-    if os.name == 'nt':  
+    if os.name == 'nt':
         os.system('echo off')
-    else:  
-        sys.stdout.write("\033[?25l")
-        sys.stdout.flush()
+    else:
+        sys.__stdout__.write("\033[?25l")
+        sys.__stdout__.flush()
 
 def show_cursor():
     if os.name == 'nt':
         os.system('echo on')
-    else:  
-        sys.stdout.write("\033[?25h")
-        sys.stdout.flush()
-
-def loading():
-    spinner_chars = ['    ', '.   ', '..  ', '... ', '....']
-    i = 0
-    message = "Fetching information"
-    
-    
-    hide_cursor()
-    
+    else:
+        sys.__stdout__.write("\033[?25h")
+        sys.__stdout__.flush()
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_progress_line(line):
+    if line.startswith(PROGRESS_PREFIX):
+        fields = line[len(PROGRESS_PREFIX):].split()
+        if len(fields) < 6:
+            return None
+        status, downloaded, total, estimate, speed, eta = fields[:6]
+        return {
+            'status': status,
+            'downloaded': _number(downloaded) or 0,
+            'total': _number(total) or _number(estimate) or 0,
+            'speed': _number(speed) or 0,
+            'eta': _number(eta)
+        }
+    if line.startswith(POSTPROCESS_PREFIX):
+        fields = line[len(POSTPROCESS_PREFIX):].split()
+        if len(fields) < 2:
+            return None
+        return {'status': "postprocess_" + fields[0], 'postprocessor': fields[1]}
+    return None
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+
+def add_job(label, phase="queued"):
+    job_id = next(_job_ids)
+    _jobs[job_id] = {'label': label, 'phase': phase, 'streams': {}, 'started': time.monotonic()}
+    _mark_dirty()
+    _ensure_renderer()
+    return job_id
+
+def update_job(job_id, **fields):
+    job = _jobs.get(job_id)
+    if job is not None:
+        job.update(fields)
+        _mark_dirty()
+
+def set_stream_progress(job_id, stream, progress):
+    # For downloads that do not go through a yt-dlp progress line
+    job = _jobs.get(job_id)
+    if job is not None:
+        job['streams'][stream] = progress
+        job['phase'] = "downloading"
+        _mark_dirty()
+
+def remove_job(job_id):
+    if _jobs.pop(job_id, None) is not None:
+        _mark_dirty()
+
+def total_speed():
+    return sum(
+        s['speed'] for job in _jobs.values() for s in job['streams'].values()
+        if s['status'] == "downloading"
+    )
+
+def job_stats(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    streams = job['streams'].values()
+    return {
+        'downloaded': sum(s['downloaded'] for s in streams),
+        'total': sum(s['total'] for s in streams),
+        'speed': sum(s['speed'] for s in streams if s['status'] == "downloading")
+    }
+
+def progress_handler(job_id, stream="main", on_other=None):
+    # Returns an on_line callback for engine.run_process. Progress lines
+    # update the job; anything else is passed on to on_other. With stream
+    # None only the phase is tracked, not the byte counts.
+    def handle(line):
+        progress = parse_progress_line(line)
+        job = _jobs.get(job_id)
+        if progress is None:
+            if on_other is not None:
+                on_other(line)
+            return
+        if job is None:
+            return
+        if progress['status'].startswith("postprocess_"):
+            if progress['status'] == "postprocess_started":
+                job['phase'] = progress['postprocessor']
+        elif stream is not None:
+            job['streams'][stream] = progress
+            job['phase'] = "downloading"
+        _mark_dirty()
+    return handle
+
+def _mark_dirty():
+    global _dirty
+    _dirty = True
+
+def _erase():
+    global _drawn_lines
+    if _drawn_lines:
+        sys.__stdout__.write(f"\033[{_drawn_lines}A\r\033[J")
+        sys.__stdout__.flush()
+        _drawn_lines = 0
+        _mark_dirty()
+
+class _TerminalWriter:
+    # Clears the dashboard before anything else is printed, so log lines
+    # end up above it instead of being overwritten by the next redraw
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        _erase()
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+def _render_line(job, tick, width):
+    label = job['label'][:32].ljust(32)
+    streams = job['streams'].values()
+    downloaded = sum(s['downloaded'] for s in streams)
+    total = sum(s['total'] for s in streams)
+    speed = sum(s['speed'] for s in streams if s['status'] == "downloading")
+
+    if not streams or job['phase'] != "downloading":
+        detail = f"{job['phase']} {SPINNER_CHARS[tick % len(SPINNER_CHARS)]}"
+    else:
+        percent = f"{downloaded * 100 / total:5.1f}%" if total else "  ?  "
+        detail = f"{percent} {format_bytes(downloaded)}/{format_bytes(total) if total else '?'} {format_bytes(speed)}/s"
+        etas = [s['eta'] for s in streams if s['eta'] is not None and s['status'] == "downloading"]
+        if etas:
+            detail += f" ETA {int(max(etas))}s"
+    return f"{label} {detail}"[:width]
+
+def _draw(tick):
+    global _drawn_lines, _dirty
+    width = shutil.get_terminal_size().columns - 1
+    lines = [_render_line(job, tick, width) for job in _jobs.values()]
+    if len(_jobs) > 1:
+        speed = total_speed()
+        limit = current_limit()
+        budget = f" of {format_bytes(limit)}/s" if limit else ""
+        lines.append(f"{len(_jobs)} active jobs - total {format_bytes(speed)}/s{budget}"[:width])
+
+    _erase()
+    sys.__stdout__.write("".join(line + "\n" for line in lines))
+    sys.__stdout__.flush()
+    _drawn_lines = len(lines)
+    _dirty = False
+
+async def render_dashboard():
+    global _renderer
+    interactive = sys.__stdout__.isatty()
+    saved_streams = sys.stdout, sys.stderr
+    if interactive:
+        sys.stdout = _TerminalWriter(sys.stdout)
+        sys.stderr = _TerminalWriter(sys.stderr)
+        hide_cursor()
+
+    tick = 0
+    try:
+        while _jobs:
+            # Rows without byte counts animate, everything else only
+            # redraws when a job changed since the last frame
+            animating = any(job['phase'] != "downloading" for job in _jobs.values())
+            if interactive and (_dirty or animating):
+                _draw(tick)
+            tick += 1
+            await asyncio.sleep(1 / MAX_REFRESH_RATE)
+    finally:
+        if interactive:
+            _erase()
+            sys.stdout, sys.stderr = saved_streams
+            show_cursor()
+        _renderer = None
+
+def _ensure_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = asyncio.ensure_future(render_dashboard())
+
+async def with_loading(coro, message="Fetching information"):
+    # Shows a dashboard row for coro while it runs on the same event loop
+    job_id = add_job(message, "")
     try:
-        while not stop_event.is_set():
-            sys.stdout.write(f"\r{message} {spinner_chars[i]}")
-            sys.stdout.flush()
-            time.sleep(0.3)
-            i = (i + 1) % len(spinner_chars)
-        
-        sys.stdout.write('\r' + ' ' * (len(message) + 5) + '\r')
-        sys.stdout.flush()
-
-    finally: 
-        show_cursor()
-
-def start_loading():
-    global loading_thread
-    if loading_thread is None or not loading_thread.is_alive():  
-        stop_event.clear()
-        loading_thread = threading.Thread(target=loading)
-        loading_thread.daemon = True
-        loading_thread.start()
-
-def stop_loading():
-    global loading_thread
-    if loading_thread and loading_thread.is_alive():
-        stop_event.set()  
-        loading_thread.join()
-        loading_thread = None
-    show_cursor()
+        return await coro
+    finally:
+        remove_job(job_id)
+        if not _jobs and _renderer is not None:
+            await asyncio.gather(_renderer, return_exceptions=True)
@@ -0,0 +1,49 @@
+import contextlib
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, there the files under .cache/ are only safe
+    # for one process at a time
+    fcntl = None
+
+@contextlib.contextmanager
+def file_lock(path):
+    # Holds an exclusive lock on path, created if needed, for the block.
+    # Every process sharing .cache/ (batch runs, the daemon, workers) takes
+    # the same lock file before a read-modify-write of a shared file.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+def hold_lock(path):
+    # Locks path for as long as the process runs; the kernel drops the lock
+    # when it exits, however it exits. Returns the open file, or None where
+    # there is no flock.
+    if fcntl is None:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    f = open(path, 'a')
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    return f
+
+def is_held(path):
+    # True while another process holds the lock hold_lock took on path
+    if fcntl is None:
+        return False
+    try:
+        with open(path, 'r') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            return False
+    except FileNotFoundError:
+        return False
@@ -1,5 +1,13 @@
+import atexit
+import cProfile
+import json
+import os
+import pstats
 import sys
-from typing import Any
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
 
 # fmt: off
 ## Text colors
@@ -110,6 +118,204 @@ def print_magenta(message: Any) -> None:
     """
     print(f"{MAGENTA}{BOLD}{message}{RESET}")
 
+# Upper bounds of the phase duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_metrics_settings = {
+    "enabled": False,
+    "events_path": ".cache/metrics/events.jsonl",
+    "textfile_path": ".cache/metrics/ytdownloader.prom"
+}
+# "phase" or "phase:step" -> {"count", "sum", "bytes", "buckets"}
+_histograms: Dict[str, Dict[str, Any]] = {}
+_metrics_lock = threading.Lock()
+_profilers = []
+_profile_path = None
+
+
+def configure_metrics(settings: Optional[Dict[str, Any]]) -> None:
+    """Applies the ``metrics`` config section and loads the saved histograms.
+
+    The histograms are kept next to the textfile so they keep counting
+    across runs, the way Prometheus expects a histogram to behave.
+
+    Args:
+        settings: The ``metrics`` section of the config, or None.
+    """
+    if settings:
+        _metrics_settings.update(settings)
+    _histograms.clear()
+    if not _metrics_settings["enabled"]:
+        return
+    try:
+        with open(_metrics_settings["textfile_path"] + ".json", "r") as f:
+            _histograms.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def _write_metrics_file(path: str, text: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Replaced atomically so a collector never reads a half written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _labels(key: str) -> str:
+    phase, _, step = key.partition(":")
+    return f'phase="{phase}",step="{step}"' if step else f'phase="{phase}"'
+
+
+def render_metrics() -> str:
+    """Renders the phase histograms in the Prometheus text format.
+
+    Returns:
+        The text for the node exporter textfile collector.
+    """
+    lines = [
+        "# HELP ytdownloader_phase_duration_seconds Time spent in each phase of a job.",
+        "# TYPE ytdownloader_phase_duration_seconds histogram"
+    ]
+    for key, histogram in sorted(_histograms.items()):
+        labels = _labels(key)
+        for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+            lines.append(f'ytdownloader_phase_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'ytdownloader_phase_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+        lines.append(f"ytdownloader_phase_duration_seconds_sum{{{labels}}} {histogram['sum']:.6f}")
+        lines.append(f"ytdownloader_phase_duration_seconds_count{{{labels}}} {histogram['count']}")
+
+    lines.append("# HELP ytdownloader_phase_bytes_total Bytes handled in each phase of a job.")
+    lines.append("# TYPE ytdownloader_phase_bytes_total counter")
+    for key, histogram in sorted(_histograms.items()):
+        lines.append(f"ytdownloader_phase_bytes_total{{{_labels(key)}}} {histogram['bytes']}")
+    return "\n".join(lines) + "\n"
+
+
+def record_phase(job: Any, phase: str, seconds: float, size: int = 0, step: str = "", **fields: Any) -> None:
+    """Records how long one phase of a job took and how many bytes it handled.
+
+    Every call appends a JSON line to the events file and updates the
+    duration histogram in the Prometheus textfile.
+
+    Args:
+        job: Identifies the job, usually the video ID.
+        phase: The phase name, e.g. ``extract``, ``download`` or ``postprocess``.
+        seconds: The duration of the phase.
+        size: The number of bytes transferred or processed.
+        step: Splits a phase further, e.g. the yt-dlp postprocessor name.
+        **fields: Extra fields written to the JSON line only.
+    """
+    if not _metrics_settings["enabled"]:
+        return
+
+    event = {"ts": round(time.time(), 3), "job": job, "phase": phase, "seconds": round(seconds, 6), "bytes": size}
+    if step:
+        event["step"] = step
+    event.update(fields)
+    key = f"{phase}:{step}" if step else phase
+
+    with _metrics_lock:
+        histogram = _histograms.setdefault(
+            key, {"count": 0, "sum": 0.0, "bytes": 0, "buckets": [0] * len(DURATION_BUCKETS)}
+        )
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["bytes"] += size or 0
+        for idx, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][idx] += 1
+
+        try:
+            events_path = _metrics_settings["events_path"]
+            directory = os.path.dirname(events_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(events_path, "a") as f:
+                f.write(json.dumps(event) + "\n")
+            textfile_path = _metrics_settings["textfile_path"]
+            _write_metrics_file(textfile_path, render_metrics())
+            _write_metrics_file(textfile_path + ".json", json.dumps(_histograms))
+        except OSError as e:
+            print_warning(f"Could not write metrics: {e}")
+
+
+@contextmanager
+def timed_phase(job: Any, phase: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """Times the body of a ``with`` block and records it with record_phase.
+
+    Args:
+        job: Identifies the job, usually the video ID.
+        phase: The phase name.
+        **fields: Passed on to record_phase.
+
+    Yields:
+        A dict; set ``size`` or other fields in it to have them recorded.
+    """
+    fields = dict(fields)
+    start = time.monotonic()
+    try:
+        yield fields
+    finally:
+        record_phase(job, phase, time.monotonic() - start, **fields)
+
+
+def enable_profiling(path: str) -> None:
+    """Profiles the Python side of the program and writes pstats data at exit.
+
+    The calling thread is profiled from now on; other threads are profiled
+    when their target is wrapped with profiled().
+
+    Args:
+        path: The file the combined pstats data is written to.
+    """
+    global _profile_path
+    if _profile_path is None:
+        atexit.register(_dump_profile)
+    _profile_path = path
+    profiler = cProfile.Profile()
+    _profilers.append(profiler)
+    profiler.enable()
+
+
+def profiled(target: Callable[[], Any]) -> Callable[[], Any]:
+    """Wraps a thread target so it runs under its own profiler.
+
+    Args:
+        target: The function the thread runs.
+
+    Returns:
+        target itself when profiling is off, otherwise a profiling wrapper.
+    """
+    if _profile_path is None:
+        return target
+
+    def run() -> Any:
+        profiler = cProfile.Profile()
+        _profilers.append(profiler)
+        profiler.enable()
+        try:
+            return target()
+        finally:
+            profiler.disable()
+
+    return run
+
+
+def _dump_profile() -> None:
+    for profiler in _profilers:
+        profiler.disable()
+    stats = pstats.Stats(*_profilers)
+    directory = os.path.dirname(_profile_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    stats.dump_stats(_profile_path)
+    print(f"Profile written to {_profile_path} (view it with: python -m pstats {_profile_path})", file=sys.stderr)
+
+
 def show_logo():
     logo = """
 ░█░█░▀█▀░█▀▄░█▀█░█░█░█▀█░█░░░█▀█░█▀█░█▀▄░█▀▀░█▀▄
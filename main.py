@@ -1,9 +1,32 @@
 #!/usr/bin/env python3
 
 import os
-from log import print_error, print_red, show_logo
+import argparse
+from log import (
+    print_error,
+    print_red,
+    print_success,
+    print_warning,
+    show_logo,
+    configure_metrics,
+    enable_profiling
+)
 from download import download_video, download_audio
-import re
+from urls import is_valid_youtube_url, is_playlist_url, dedup_urls
+from cache import configure_cache, cache_stats
+from archive import configure_archive, verify_archive, forget_download
+from batch import read_urls, run_batch, resume_batch, print_batch_summary
+from daemon import configure_daemon, serve
+from extractor import configure_extractor
+from bandwidth import configure_bandwidth
+from tuning import configure_tuning
+from sync import configure_sync
+from storage import configure_storage
+from segmented import configure_segmented
+from throttle import configure_throttle
+from journal import configure_journal, unfinished_jobs
+from workqueue import configure_queue, enqueue, queue_counts, run_worker
+import engine
 import sys
 import shutil
 from config import load_config, ensure_download_path_exists
@@ -11,20 +34,195 @@ from config import load_config, ensure_download_path_exists
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def is_valid_youtube_url(url):
-    if not url:
-        return False
-    pattern = re.compile(
-        r"^(https?://)?(www\.)?"
-        r"(youtube\.com/(watch\?v=|embed/|v/|shorts/"
-        r"|playlist\?list=|user/|c/|channel/)|youtu\.be/)"
-        r"[A-Za-z0-9_-]+"
-        r"([?&][A-Za-z0-9_=-]+)*$"
-    )
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download videos and audio from YouTube")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached video information and extract it again")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="show info cache statistics and exit")
+    parser.add_argument("--force", action="store_true",
+                        help="download videos again even if the archive lists them as done")
+    parser.add_argument("--verify-archive", action="store_true",
+                        help="list archived downloads whose files are missing or changed, then exit")
+    parser.add_argument("--check-hashes", action="store_true",
+                        help="with --verify-archive, also compare file hashes")
+    parser.add_argument("--prune", action="store_true",
+                        help="with --verify-archive, remove broken entries so they are downloaded again")
+    parser.add_argument("--interactive", action="store_true",
+                        help="always ask which format to download instead of using the format policy")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="download every URL listed in FILE (one per line, '-' for stdin)")
+    parser.add_argument("--sync", metavar="URL", nargs="+",
+                        help="download the videos added to these channels or playlists since their last sync")
+    parser.add_argument("--resume", action="store_true",
+                        help="finish the jobs an earlier run left unfinished, with the formats it chose")
+    parser.add_argument("--enqueue", metavar="URL", nargs="+",
+                        help="add URLs to the shared queue for --worker processes")
+    parser.add_argument("--worker", action="store_true",
+                        help="download jobs from the shared queue until stopped")
+    parser.add_argument("--drain", action="store_true",
+                        help="with --worker, exit once the queue is empty")
+    parser.add_argument("--audio", action="store_true",
+                        help="download audio instead of video in batch and sync mode")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay running and accept downloads from client.py over a Unix socket")
+    parser.add_argument("--http-port", type=int, metavar="PORT",
+                        help="with --daemon, also accept jobs over HTTP on 127.0.0.1:PORT")
+    parser.add_argument("--backend", choices=["subprocess", "library"],
+                        help="extract information with a yt-dlp process per URL or in-process with the yt_dlp module")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record phase timings even if metrics are disabled in config.json")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the Python side and write pstats data to FILE")
+    parser.add_argument("--extract-workers", type=int,
+                        help="number of URLs to extract information for at the same time")
+    parser.add_argument("--download-workers", type=int,
+                        help="number of downloads to run at the same time")
+    return parser.parse_args()
 
-    return re.match(pattern, url) is not None
+def run_jobs(urls, content_type, config, args, sync=False):
+    try:
+        jobs = engine.run(run_batch(
+            urls,
+            content_type,
+            config[content_type.lower()],
+            args.extract_workers or config['batch']['extract_workers'],
+            args.download_workers or config['batch']['download_workers'],
+            args.refresh,
+            args.force,
+            config['batch']['postprocess_workers'],
+            sync
+        ))
+    except KeyboardInterrupt:
+        print_red("Batch cancelled by user")
+        return None
+    print_batch_summary(jobs)
+    return jobs
+
+def run_resume(args, config, records):
+    if not records:
+        print_success("No unfinished jobs to resume")
+        return
+    print(f"Resuming {len(records)} unfinished jobs")
+    try:
+        jobs = engine.run(resume_batch(
+            records,
+            config,
+            args.extract_workers or config['batch']['extract_workers'],
+            args.download_workers or config['batch']['download_workers'],
+            args.refresh,
+            config['batch']['postprocess_workers']
+        ))
+    except KeyboardInterrupt:
+        print_red("Resume cancelled by user, run --resume again to continue")
+        sys.exit(130)
+    print_batch_summary(jobs)
+
+def run_enqueue(args, config):
+    urls = []
+    for url in args.enqueue:
+        if is_valid_youtube_url(url):
+            urls.append(url)
+        else:
+            print_error(f"'{url}' Is not a valid youtube url")
+    urls, duplicates = dedup_urls(urls)
+    if duplicates:
+        print_warning(f"Skipping {duplicates} duplicate URLs")
+    try:
+        ids = enqueue(urls, "Audio" if args.audio else "Video", args.force)
+        counts = queue_counts()
+    except (OSError, RuntimeError) as e:
+        print_error(f"Could not queue the jobs: {e}")
+        sys.exit(1)
+    print_success(f"Queued {len(ids)} jobs, {counts['pending']} pending and {counts['claimed']} running")
+
+def run_worker_mode(args, config):
+    try:
+        finished = engine.run(run_worker(
+            config,
+            args.extract_workers or config['batch']['extract_workers'],
+            args.download_workers or config['batch']['download_workers'],
+            args.refresh,
+            config['batch']['postprocess_workers'],
+            args.drain
+        ))
+    except (OSError, RuntimeError) as e:
+        print_error(e)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print_red("Worker stopped, its unfinished jobs were handed back to the queue")
+        return
+    print_success(f"Queue empty: {finished['done']} done, {finished['failed']} failed, {finished['skipped']} skipped")
+
+def run_verify_archive(args):
+    problems = 0
+    for video_id, content_type, path, problem in verify_archive(args.check_hashes):
+        problems += 1
+        print_warning(f"{video_id} ({content_type}): {problem}: {path}")
+        if args.prune:
+            forget_download(video_id, content_type)
+
+    if problems == 0:
+        print_success("All archived downloads are present")
+    elif args.prune:
+        print_success(f"Removed {problems} broken entries from the archive")
+
+def run_daemon(args, config):
+    try:
+        engine.run(serve(
+            config,
+            args.extract_workers or config['batch']['extract_workers'],
+            args.download_workers or config['batch']['download_workers'],
+            args.refresh,
+            is_valid_youtube_url,
+            config['batch']['postprocess_workers']
+        ))
+    except RuntimeError as e:
+        print_error(e)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print_red("Daemon stopped")
+
+def run_batch_mode(args, config):
+    try:
+        urls = read_urls(args.batch)
+    except OSError as e:
+        print_error(f"Could not read URL list: {e}")
+        sys.exit(1)
+
+    valid_urls = []
+    for url in urls:
+        if is_valid_youtube_url(url):
+            valid_urls.append(url)
+        else:
+            print_error(f"'{url}' Is not a valid youtube url")
+
+    # Different links to the same video are downloaded once
+    valid_urls, duplicates = dedup_urls(valid_urls)
+    if duplicates:
+        print_warning(f"Skipping {duplicates} duplicate URLs")
+
+    content_type = "Audio" if args.audio else "Video"
+    if run_jobs(valid_urls, content_type, config, args) is None:
+        sys.exit(130)
+
+def run_sync_mode(args, config):
+    sources = []
+    for url in args.sync:
+        if is_valid_youtube_url(url) and is_playlist_url(url):
+            sources.append(url)
+        else:
+            print_error(f"'{url}' Is not a youtube channel or playlist url")
+
+    content_type = "Audio" if args.audio else "Video"
+    if run_jobs(sources, content_type, config, args, sync=True) is None:
+        sys.exit(130)
 
 def main():
+    args = parse_args()
+    if args.profile:
+        enable_profiling(args.profile)
+
     yt_dlp = shutil.which("yt-dlp")
     if yt_dlp:
         pass
@@ -36,6 +234,73 @@ def main():
     if not ensure_download_path_exists(config):
         print_error("Download path does not exist or could not be created. Exiting.")
         sys.exit(1)
+    configure_cache(config['cache'])
+    configure_archive(config['archive'])
+    if args.worker:
+        # The shared queue tracks the worker's jobs; a local journal would
+        # let --resume run them a second time
+        config['journal']['enabled'] = False
+    configure_journal(config['journal'])
+    configure_queue(config['queue'])
+    if args.metrics:
+        config['metrics']['enabled'] = True
+    configure_metrics(config['metrics'])
+    if args.http_port:
+        config['daemon']['http_port'] = args.http_port
+    configure_daemon(config['daemon'])
+    if args.backend:
+        config['extraction']['backend'] = args.backend
+    configure_extractor(config['extraction'])
+    configure_throttle(config['throttle'])
+    configure_tuning(config['tuning'])
+    configure_sync(config['sync'])
+    configure_storage(config['storage'])
+    configure_segmented(config['segmented'])
+    try:
+        configure_bandwidth(config['bandwidth'])
+    except (ValueError, KeyError) as e:
+        print_error(f"Invalid bandwidth setting: {e}")
+        sys.exit(1)
+    if args.interactive:
+        config['video']['format_selection'] = "interactive"
+        config['audio']['format_selection'] = "interactive"
+
+    if args.cache_stats:
+        stats = cache_stats()
+        print(f"Entries: {stats['entries']} ({stats['size'] / (1024*1024):.1f} MB)")
+        print(f"Hits: {stats['hits']}  Misses: {stats['misses']}")
+        return
+
+    if args.verify_archive:
+        run_verify_archive(args)
+        return
+
+    if args.enqueue:
+        run_enqueue(args, config)
+        return
+
+    if args.worker:
+        run_worker_mode(args, config)
+        return
+
+    unfinished = unfinished_jobs()
+    if args.resume:
+        run_resume(args, config, unfinished)
+        return
+    if unfinished:
+        print_warning(f"{len(unfinished)} jobs of an earlier run did not finish, continue them with --resume")
+
+    if args.batch:
+        run_batch_mode(args, config)
+        return
+
+    if args.sync:
+        run_sync_mode(args, config)
+        return
+
+    if args.daemon:
+        run_daemon(args, config)
+        return
 
     clear_screen()
     show_logo()
@@ -57,8 +322,10 @@ def main():
                     print("│ Enter video url or 0 to cancel   │")
                     print("╰" + "─" * 34 + "╯")
                     input_video_url = str(input("Enter The Url: ")).strip()
-                    if is_valid_youtube_url(input_video_url):
-                        download_video(input_video_url, config['video'])
+                    if is_playlist_url(input_video_url) and is_valid_youtube_url(input_video_url):
+                        run_jobs([input_video_url], "Video", config, args)
+                    elif is_valid_youtube_url(input_video_url):
+                        download_video(input_video_url, config['video'], args.refresh, args.force)
                     elif input_video_url == "0":
                         clear_screen()
                         show_logo()
@@ -74,8 +341,10 @@ def main():
                     print("│ Enter audio url or 0 to cancel   │")
                     print("╰" + "─" * 34 + "╯")
                     input_audio_url = str(input("Enter The Url: ")).strip()
-                    if is_valid_youtube_url(input_audio_url):
-                        download_audio(input_audio_url, config['audio'])
+                    if is_playlist_url(input_audio_url) and is_valid_youtube_url(input_audio_url):
+                        run_jobs([input_audio_url], "Audio", config, args)
+                    elif is_valid_youtube_url(input_audio_url):
+                        download_audio(input_audio_url, config['audio'], args.refresh, args.force)
                     elif input_audio_url == "0":
                         clear_screen()
                         show_logo()
@@ -0,0 +1,85 @@
+CODEC_FAMILIES = {
+    "avc1": "h264",
+    "avc3": "h264",
+    "h264": "h264",
+    "vp9": "vp9",
+    "vp09": "vp9",
+    "vp8": "vp8",
+    "av01": "av1",
+    "av1": "av1",
+    "hev1": "h265",
+    "hvc1": "h265",
+    "mp4a": "aac",
+    "aac": "aac",
+    "opus": "opus",
+    "vorbis": "vorbis",
+    "mp3": "mp3"
+}
+
+def codec_family(codec):
+    codec = (codec or "").lower()
+    return CODEC_FAMILIES.get(codec.split(".")[0], codec)
+
+def _rank(value, preferred):
+    # Position in the preference list, anything unlisted ranks last
+    try:
+        return preferred.index(value)
+    except ValueError:
+        return len(preferred)
+
+def _protocol_rank(protocol, preferred):
+    for idx, name in enumerate(preferred):
+        if name in protocol.split("+"):
+            return idx
+    return len(preferred)
+
+def selection_key(fmt, policy, is_audio=False):
+    # Returns None when the format is excluded by the policy, otherwise a
+    # tuple where smaller is better. policy comes from compile_policy().
+    max_size = policy.get("max_filesize_mb")
+    size = fmt.get('filesize') or 0
+    if max_size and size > max_size * 1024 * 1024:
+        return None
+
+    if is_audio:
+        quality = fmt.get('abr') or 0
+        codec = codec_family(fmt.get('acodec'))
+        if quality < (policy.get("min_abr") or 0):
+            return None
+        if policy.get("max_abr") and quality > policy["max_abr"]:
+            return None
+    else:
+        quality = fmt.get('height') or 0
+        codec = codec_family(fmt.get('vcodec'))
+        if policy.get("max_height") and quality > policy["max_height"]:
+            return None
+        if quality < (policy.get("min_height") or 0):
+            return None
+
+    if policy.get("allow_codecs") and codec not in policy["allow_codecs"]:
+        return None
+
+    return (
+        -quality,
+        _rank(codec, policy.get("prefer_codecs", [])),
+        _protocol_rank(fmt.get('protocol') or "", policy.get("prefer_protocols", [])),
+        _rank(fmt.get('ext'), policy.get("prefer_exts", [])),
+        size or float("inf")
+    )
+
+def compile_policy(policy):
+    policy = dict(policy or {})
+    policy["prefer_codecs"] = [codec_family(c) for c in policy.get("prefer_codecs", [])]
+    policy["allow_codecs"] = [codec_family(c) for c in policy.get("allow_codecs", [])]
+    return policy
+
+def select_format(formats, policy=None, is_audio=False):
+    # One pass, each format's key is computed exactly once
+    policy = compile_policy(policy)
+    best = None
+    best_key = None
+    for fmt in formats:
+        key = selection_key(fmt, policy, is_audio)
+        if key is not None and (best_key is None or key < best_key):
+            best, best_key = fmt, key
+    return best
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import shutil
+from log import print_warning
+
+# Merging and embedding write a second copy of the file next to the first
+# before deleting it, so a file needs twice its size where it is processed
+STAGING_FACTOR = 2
+# Seconds between free space checks while a job is held back
+ADMISSION_POLL = 2.0
+
+_settings = {
+    "staging_path": None,
+    "reserve_mb": 512
+}
+# Bytes promised to admitted jobs that are not written yet, per device
+_reserved = {}
+
+def configure_storage(settings):
+    if settings:
+        _settings.update(settings)
+
+def final_dir(config):
+    return config.get("download_path", "/sdcard/Download/YouTubeDownload/")
+
+def work_dir(config):
+    # Where yt-dlp writes parts, merges and embeds
+    return _settings["staging_path"] or final_dir(config)
+
+def _device(path):
+    # The nearest existing parent tells which filesystem path is on
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev, path
+
+def _needs(config, size):
+    needs = {}
+    for path, factor in ((work_dir(config), STAGING_FACTOR), (final_dir(config), 1)):
+        device, existing = _device(path)
+        if device in needs:
+            # Moving within one filesystem is a rename
+            continue
+        needs[device] = (existing, size * factor)
+    return needs
+
+def _shortage(needs):
+    # Returns (path, missing bytes, whether other jobs hold reservations
+    # there), or None when every location has room
+    reserve = _settings["reserve_mb"] * 1024 * 1024
+    for device, (path, need) in needs.items():
+        free = shutil.disk_usage(path).free - _reserved.get(device, 0) - reserve
+        if free < need:
+            return path, need - free, _reserved.get(device, 0) > 0
+    return None
+
+async def admit(config, size, on_wait=None):
+    # Waits until the staging and download directories both have room for
+    # a file of size bytes, then reserves it until release(). Raises
+    # OSError right away if the file cannot fit even once other jobs are
+    # done. Unknown sizes (0) only need the configured reserve.
+    needs = _needs(config, size or 0)
+    while True:
+        shortage = _shortage(needs)
+        if shortage is None:
+            break
+        path, missing, others = shortage
+        if not others:
+            raise OSError(f"Not enough free space in {path} ({missing / (1024 * 1024):.0f} MB missing)")
+        if on_wait:
+            on_wait(path)
+        await asyncio.sleep(ADMISSION_POLL)
+
+    for device, (_, need) in needs.items():
+        _reserved[device] = _reserved.get(device, 0) + need
+    return needs
+
+def release(reservation):
+    for device, (_, need) in (reservation or {}).items():
+        _reserved[device] = max(_reserved.get(device, 0) - need, 0)
+
+def _move(source, destination):
+    try:
+        os.replace(source, destination)
+        return
+    except OSError:
+        pass
+    # Another filesystem: copy next to the destination, then rename, so the
+    # download directory never holds a partial file
+    tmp_path = destination + ".ytdownloader-tmp"
+    try:
+        shutil.copyfile(source, tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, destination)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(source)
+
+def publish(files, config):
+    # Moves finished files from the staging directory to the same relative
+    # path under download_path, returning their new paths
+    staging = _settings["staging_path"]
+    if not staging:
+        return files
+    staging = os.path.abspath(staging)
+    published = []
+    for path in files:
+        relative = os.path.relpath(os.path.abspath(path), staging)
+        if relative.startswith(os.pardir) or not os.path.exists(path):
+            published.append(path)
+            continue
+        destination = os.path.join(final_dir(config), relative)
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        if os.path.exists(destination):
+            print_warning(f"Replacing existing file {destination}")
+        _move(path, destination)
+        published.append(destination)
+    return published
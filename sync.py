@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from download import iter_playlist_entries, entry_url
+from urls import parse_url, canonical_url
+from log import print_success, print_warning
+
+# A channel URL without a tab lists its tabs (Videos, Shorts, Live) rather
+# than uploads; syncing it means syncing the Videos tab, newest first
+CHANNEL_TABS = ("/videos", "/shorts", "/streams", "/playlists", "/featured")
+# IDs remembered per source. More than one, so a deleted video does not
+# make the next sync run to the end of the channel.
+KEEP_IDS = 50
+# Playlists grow at the end and are listed from the last known position.
+# Starting this many entries earlier tolerates that many removals.
+PLAYLIST_OVERLAP = 10
+
+_settings = {
+    "path": ".cache/sync.json"
+}
+_cursors = None
+
+def configure_sync(settings):
+    global _cursors
+    if settings:
+        _settings.update(settings)
+    _cursors = None
+
+def _load():
+    global _cursors
+    if _cursors is None:
+        try:
+            with open(_settings["path"], 'r') as f:
+                _cursors = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _cursors = {}
+    return _cursors
+
+def _save():
+    try:
+        directory = os.path.dirname(_settings["path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = _settings["path"] + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(_cursors, f, indent=2)
+        os.replace(tmp_path, _settings["path"])
+    except OSError as e:
+        print_warning(f"Could not save sync cursors: {e}")
+
+def sync_source_url(url):
+    parsed = parse_url(url)
+    if parsed and parsed['kind'] == "channel" and not parsed['url'].endswith(CHANNEL_TABS):
+        return parsed['url'] + "/videos"
+    return canonical_url(url)
+
+def _is_channel(source):
+    return "youtube.com/playlist" not in source
+
+async def _list(source, items, on_entry, known, stop_at_known):
+    # Returns (entries listed, new entries, whether a known ID was listed)
+    listed, new, found_known = 0, [], False
+    entries = iter_playlist_entries(source, items=items)
+    try:
+        async for entry in entries:
+            listed += 1
+            video_id = entry.get('id')
+            if video_id in known:
+                found_known = True
+                if stop_at_known:
+                    break
+                continue
+            link = entry_url(entry)
+            if link:
+                new.append((video_id, link))
+                on_entry(link)
+    finally:
+        # Closing the generator kills yt-dlp instead of letting it list
+        # the rest of the channel
+        await entries.aclose()
+    return listed, new, found_known
+
+async def sync_source(url, content_type, on_entry):
+    # Hands on_entry the URLs of videos added to a channel or playlist since
+    # its last sync, plus the ones that failed last time. The cursor only
+    # moves in commit_sync, once the downloads are done.
+    source = sync_source_url(url)
+    key = f"{content_type}:{source}"
+    cursor = _load().get(key, {"ids": [], "count": 0, "retry": []})
+    known = set(cursor["ids"])
+
+    for link in cursor["retry"]:
+        on_entry(link)
+
+    start_time = time.monotonic()
+    if _is_channel(source):
+        # Uploads are listed newest first, the first known ID ends the list
+        listed, new, _ = await _list(source, None, on_entry, known, True)
+        count = cursor["count"] + len(new)
+    else:
+        start = max(cursor["count"] - PLAYLIST_OVERLAP, 0)
+        listed, new, found_known = await _list(source, f"{start + 1}:" if start else None, on_entry, known, False)
+        count = start + listed
+        if start and not found_known:
+            # None of the overlap is known: the playlist was reordered or
+            # shrank a lot, list it again from the top
+            seen = known | {video_id for video_id, _ in new}
+            listed, more, _ = await _list(source, None, on_entry, seen, False)
+            new += more
+            count = listed
+
+    return {
+        'key': key,
+        'source': source,
+        'count': count,
+        'new': new,
+        'retry': list(cursor["retry"]),
+        'listed': listed,
+        'seconds': time.monotonic() - start_time
+    }
+
+def commit_sync(listing, jobs):
+    # Every listed ID becomes known; the ones whose download failed are
+    # queued again on the next sync
+    cursors = _load()
+    cursor = cursors.get(listing['key'], {"ids": [], "count": 0, "retry": []})
+    status = {job['url']: job['status'] for job in jobs}
+    retry = [
+        link for link in listing['retry'] + [link for _, link in listing['new']]
+        if status.get(link) not in ("done", "skipped")
+    ]
+    new_ids = [video_id for video_id, _ in listing['new'] if video_id]
+    if not _is_channel(listing['source']):
+        # Playlist entries come oldest first, keep the end of the list
+        new_ids.reverse()
+    cursors[listing['key']] = {
+        "source": listing['source'],
+        "ids": (new_ids + [i for i in cursor["ids"] if i not in new_ids])[:KEEP_IDS],
+        "count": listing['count'],
+        "retry": list(dict.fromkeys(retry)),
+        "synced_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    _save()
+    print_success(
+        f"{listing['source']}: {len(listing['new'])} new, {len(listing['retry'])} retried "
+        f"(listed {listing['listed']} entries in {listing['seconds']:.1f}s)"
+    )
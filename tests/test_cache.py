@@ -0,0 +1,37 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+
+class UnwritableCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict(cache._settings)
+        self.work_dir = tempfile.TemporaryDirectory()
+        # A path below a regular file can never be created, even as root
+        blocker = os.path.join(self.work_dir.name, "file")
+        open(blocker, 'w').close()
+        cache.configure_cache({'enabled': True, 'path': os.path.join(blocker, "info")})
+
+    def tearDown(self):
+        cache._settings.clear()
+        cache._settings.update(self.saved)
+        self.work_dir.cleanup()
+
+    def test_lookup_is_a_miss(self):
+        with contextlib.redirect_stderr(io.StringIO()) as output:
+            self.assertIsNone(cache.get_cached_info("aaaaaaaaaaa"))
+        self.assertIn("Could not update info cache index", output.getvalue())
+
+    def test_store_does_not_raise(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            cache.store_info("aaaaaaaaaaa", {'id': "aaaaaaaaaaa", 'formats': []})
+            self.assertIsNone(cache.get_cached_info("aaaaaaaaaaa"))
+
+if __name__ == "__main__":
+    unittest.main()
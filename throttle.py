@@ -0,0 +1,125 @@
+import asyncio
+import random
+import re
+import time
+from urllib.parse import urlparse
+from log import print_warning, record_phase
+
+# What yt-dlp prints when YouTube rate limits an address
+THROTTLE_PATTERN = re.compile(
+    r"HTTP Error 429|Too Many Requests|Sign in to confirm|confirm you.re not a bot|rate.?limit",
+    re.IGNORECASE
+)
+# Consecutive successful extractions before a host gets one more
+# concurrent extraction and a faster request rate
+GROW_AFTER = 10
+GROWTH = 1.25
+
+_settings = {
+    "rate": 2.0,
+    "burst": 4,
+    "max_concurrency": 4,
+    "retries": 4,
+    "base_delay": 5.0,
+    "max_delay": 300.0
+}
+_hosts = {}
+
+def configure_throttle(settings):
+    if settings:
+        _settings.update(settings)
+    _hosts.clear()
+
+def is_throttled(error):
+    return bool(error) and THROTTLE_PATTERN.search(str(error)) is not None
+
+def _host(url):
+    return urlparse(url or "").hostname or ""
+
+def _state(host):
+    state = _hosts.get(host)
+    if state is None:
+        state = _hosts[host] = {
+            'tokens': float(_settings["burst"]),
+            'rate': float(_settings["rate"]),
+            'updated': time.monotonic(),
+            'limit': _settings["max_concurrency"],
+            'active': 0,
+            'successes': 0,
+            'strikes': 0,
+            'until': 0.0,
+            'decreased': 0.0
+        }
+    return state
+
+def _refill(state, now):
+    state['tokens'] = min(state['tokens'] + (now - state['updated']) * state['rate'], _settings["burst"])
+    state['updated'] = now
+
+async def _acquire(state):
+    # A request needs a free concurrency slot, a token from the host's
+    # bucket and the host not to be in a backoff pause
+    while True:
+        now = time.monotonic()
+        _refill(state, now)
+        if now < state['until']:
+            wait = state['until'] - now
+        elif state['active'] >= state['limit']:
+            wait = 0.1
+        elif state['tokens'] < 1:
+            wait = (1 - state['tokens']) / state['rate']
+        else:
+            state['tokens'] -= 1
+            state['active'] += 1
+            return now
+        await asyncio.sleep(wait)
+
+def _throttled(state, host, started):
+    # Multiplicative decrease: half the concurrency and rate, and a pause
+    # that doubles with every throttle in a row. Jitter keeps the waiting
+    # extractions from all retrying at the same moment.
+    now = time.monotonic()
+    if started < state['decreased']:
+        # Sent before the last decrease, the same throttle again
+        return max(state['until'] - now, 0.0)
+    state['decreased'] = now
+    state['successes'] = 0
+    state['strikes'] += 1
+    state['limit'] = max(state['limit'] // 2, 1)
+    state['rate'] = max(state['rate'] / 2, 0.05)
+    state['tokens'] = 0.0
+    delay = min(_settings["base_delay"] * 2 ** (state['strikes'] - 1), _settings["max_delay"])
+    delay *= random.uniform(0.5, 1.5)
+    state['until'] = now + delay
+    print_warning(
+        f"{host} is throttling requests, pausing {delay:.0f}s "
+        f"({state['limit']} at a time, {state['rate']:.2f}/s afterwards)"
+    )
+    return delay
+
+def _succeeded(state):
+    # Additive increase once the host has been fine for a while
+    state['strikes'] = 0
+    state['successes'] += 1
+    if state['successes'] >= GROW_AFTER:
+        state['successes'] = 0
+        state['limit'] = min(state['limit'] + 1, _settings["max_concurrency"])
+        state['rate'] = min(state['rate'] * GROWTH, _settings["rate"])
+
+async def paced(url, attempt, video_id=None):
+    # Runs attempt() -> (result, error) paced per host, retrying while the
+    # error says the host is throttling us
+    host = _host(url)
+    state = _state(host)
+    for retry in range(_settings["retries"] + 1):
+        started = await _acquire(state)
+        try:
+            result, error = await attempt()
+        finally:
+            state['active'] -= 1
+        if not is_throttled(error):
+            _succeeded(state)
+            return result, error
+        delay = _throttled(state, host, started)
+        record_phase(video_id, "backoff", delay, host=host, retry=retry)
+    return result, error
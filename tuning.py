@@ -0,0 +1,116 @@
+import json
+import os
+from urllib.parse import urlparse
+from log import print_warning
+
+# Fragmented streams are tuned by how many fragments yt-dlp fetches at
+# once (-N), plain HTTP streams by the size of each ranged request
+# (--http-chunk-size, 0 meaning one request for the whole file)
+FRAGMENTED_PROTOCOLS = ("m3u8", "m3u8_native", "http_dash_segments", "http_dash_segments_generator")
+HTTP_PROTOCOLS = ("https", "http")
+LADDERS = {
+    "fragments": [1, 2, 4, 8, 16],
+    "chunks": [0, 1024 ** 2, 4 * 1024 ** 2, 10 * 1024 ** 2]
+}
+START_LEVELS = {"fragments": 2, "chunks": 0}
+# Throughput is measured over this many seconds after the first byte
+PROBE_SECONDS = 5
+# Shorter measurements are too noisy to keep
+MIN_PROBE_SECONDS = 1
+# Every EXPLORE_EVERY-th download of a profile tries a neighbouring setting
+EXPLORE_EVERY = 4
+SMOOTHING = 0.3
+
+_settings = {
+    "enabled": True,
+    "path": ".cache/tuning.json"
+}
+_profiles = None
+
+def configure_tuning(settings):
+    global _profiles
+    if settings:
+        _settings.update(settings)
+    _profiles = None
+
+def url_host(url):
+    # Stream hosts differ per video (rr3---sn-xyz.googlevideo.com), the
+    # profile is kept for the domain they share
+    host = urlparse(url or "").hostname or ""
+    return ".".join(host.split(".")[-2:])
+
+def _load():
+    global _profiles
+    if _profiles is None:
+        try:
+            with open(_settings["path"], 'r') as f:
+                _profiles = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _profiles = {}
+    return _profiles
+
+def _save():
+    try:
+        directory = os.path.dirname(_settings["path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = _settings["path"] + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(_profiles, f, indent=2)
+        os.replace(tmp_path, _settings["path"])
+    except OSError as e:
+        print_warning(f"Could not save download tuning profile: {e}")
+
+def _kind(protocol):
+    protocol = protocol or ""
+    if any(part in FRAGMENTED_PROTOCOLS for part in protocol.split("+")):
+        return "fragments"
+    if protocol in HTTP_PROTOCOLS:
+        return "chunks"
+    return None
+
+def _best_level(profile, kind):
+    levels = profile["levels"]
+    if not levels:
+        return START_LEVELS[kind]
+    return int(max(levels, key=lambda level: levels[level]["throughput"]))
+
+def choose_settings(fmt):
+    # Returns the settings to download fmt with: the profile's best so far,
+    # or now and then a neighbour of it to keep learning. None when the
+    # format's protocol is not tuned.
+    kind = _kind(fmt.get('protocol'))
+    if not _settings["enabled"] or kind is None:
+        return None
+
+    key = f"{kind}:{fmt.get('protocol')}:{fmt.get('host') or ''}"
+    profile = _load().get(key, {"levels": {}, "runs": 0})
+    level = _best_level(profile, kind)
+    if profile["runs"] % EXPLORE_EVERY == EXPLORE_EVERY - 1:
+        ladder = LADDERS[kind]
+        neighbours = [n for n in (level - 1, level + 1) if 0 <= n < len(ladder)]
+        # The neighbour measured least often gets the next try
+        level = min(neighbours, key=lambda n: profile["levels"].get(str(n), {}).get("samples", 0))
+
+    value = LADDERS[kind][level]
+    if kind == "fragments":
+        args = ["--concurrent-fragments", str(value)]
+    else:
+        args = ["--http-chunk-size", str(value)] if value else []
+    return {'key': key, 'kind': kind, 'level': level, 'value': value, 'args': args}
+
+def record_throughput(settings, throughput):
+    # Keeps a smoothed throughput per setting, so one slow download does
+    # not throw away what earlier ones measured
+    profiles = _load()
+    profile = profiles.setdefault(settings['key'], {"levels": {}, "runs": 0})
+    entry = profile["levels"].setdefault(str(settings['level']), {
+        "value": settings['value'],
+        "throughput": throughput,
+        "samples": 0
+    })
+    if entry["samples"]:
+        entry["throughput"] += SMOOTHING * (throughput - entry["throughput"])
+    entry["samples"] += 1
+    profile["runs"] += 1
+    _save()
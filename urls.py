@@ -0,0 +1,89 @@
+import re
+from urllib.parse import urlsplit, parse_qs
+
+# Every form of a YouTube link is reduced to one canonical URL per video,
+# playlist or channel, so the batch queue, the info cache and the archive
+# all see the same key for it
+HOST_PATTERN = re.compile(r"^(?:www\.|m\.|music\.)?youtube\.com$|^youtu\.be$")
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+PLAYLIST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{10,}$")
+VIDEO_PATH_PATTERN = re.compile(r"^/(?:embed|v|shorts|live)/([A-Za-z0-9_-]{11})(?:/|$)")
+CHANNEL_PATH_PATTERN = re.compile(
+    r"^/(?:(channel|user|c)/([A-Za-z0-9_.-]+)|(@[\w.-]+))"
+    r"(?:/(videos|shorts|streams|playlists|featured))?/?$"
+)
+SCHEME_PATTERN = re.compile(r"^[a-z][a-z0-9+.-]*://", re.IGNORECASE)
+
+def parse_url(url):
+    # Returns {'kind', 'id', 'url'} for a YouTube video, playlist or channel
+    # link, or None for anything else. kind is "video", "playlist" or
+    # "channel"; url is the canonical form.
+    url = (url or "").strip()
+    if not url:
+        return None
+    if not SCHEME_PATTERN.match(url):
+        url = "https://" + url
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not HOST_PATTERN.match((parts.hostname or "").lower()):
+        return None
+    query = parse_qs(parts.query)
+
+    if parts.hostname.lower() == "youtu.be":
+        video_id = parts.path.strip("/")
+        if VIDEO_ID_PATTERN.match(video_id):
+            return _video(video_id)
+        return None
+
+    if parts.path in ("/watch", "/watch/"):
+        video_id = query.get("v", [""])[0]
+        return _video(video_id) if VIDEO_ID_PATTERN.match(video_id) else None
+
+    match = VIDEO_PATH_PATTERN.match(parts.path)
+    if match:
+        return _video(match.group(1))
+
+    if parts.path in ("/playlist", "/playlist/"):
+        playlist_id = query.get("list", [""])[0]
+        if PLAYLIST_ID_PATTERN.match(playlist_id):
+            return {
+                'kind': "playlist",
+                'id': playlist_id,
+                'url': f"https://www.youtube.com/playlist?list={playlist_id}"
+            }
+        return None
+
+    match = CHANNEL_PATH_PATTERN.match(parts.path)
+    if match:
+        prefix, name, handle, tab = match.groups()
+        channel = handle or f"{prefix}/{name}"
+        return {
+            'kind': "channel",
+            'id': handle or name,
+            'url': f"https://www.youtube.com/{channel}" + (f"/{tab}" if tab else "")
+        }
+    return None
+
+def _video(video_id):
+    return {'kind': "video", 'id': video_id, 'url': f"https://www.youtube.com/watch?v={video_id}"}
+
+def is_valid_youtube_url(url):
+    return parse_url(url) is not None
+
+def is_playlist_url(url):
+    parsed = parse_url(url)
+    return parsed is not None and parsed['kind'] != "video"
+
+def video_id_from_url(url):
+    parsed = parse_url(url)
+    return parsed['id'] if parsed and parsed['kind'] == "video" else None
+
+def canonical_url(url):
+    # Other sites are handed to yt-dlp as they are
+    parsed = parse_url(url)
+    return parsed['url'] if parsed else (url or "").strip()
+
+def dedup_urls(urls):
+    # Returns the canonical URLs in their first order and how many inputs
+    # were duplicates
+    unique = list(dict.fromkeys(canonical_url(url) for url in urls))
+    return unique, len(urls) - len(unique)
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from batch import new_job, make_slots, run_job, expand_playlist
+from urls import is_playlist_url, canonical_url
+from log import print_success, print_warning
+
+# A job is a JSON file that moves between the directories of the queue:
+#   pending/  waiting for a worker
+#   claimed/  being worked on, as <job>@<claim>.json where the claim names
+#             the worker and is new for every claim; the file's mtime is
+#             the lease heartbeat
+#   done/ and failed/  finished, with the worker's result
+# Claiming and reclaiming are renames, which are atomic on one filesystem,
+# so any number of workers on any number of hosts can share the directory.
+# A worker only ever touches its own claim file, so one whose lease was
+# taken over finds the file gone instead of renewing someone else's lease.
+# The hosts' clocks need to agree to within a few seconds.
+STATES = ("pending", "claimed", "done", "failed", "tmp")
+
+_settings = {
+    "path": None,
+    "lease_seconds": 60,
+    "heartbeat_seconds": 15,
+    "max_attempts": 3,
+    "poll_seconds": 2.0,
+    "prefetch": 1
+}
+
+def configure_queue(settings):
+    if settings:
+        _settings.update(settings)
+
+def _dir(state):
+    if not _settings["path"]:
+        raise RuntimeError("No queue directory configured, set queue.path in config.json")
+    return os.path.join(_settings["path"], state)
+
+def _ensure_dirs():
+    for state in STATES:
+        os.makedirs(_dir(state), exist_ok=True)
+
+def _write(state, name, record):
+    # Written under tmp/ and renamed, so no reader sees half a file
+    tmp_path = os.path.join(_dir("tmp"), f"{name}.{uuid.uuid4().hex}")
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(_dir(state), name))
+
+def _read(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def enqueue(urls, content_type, force=False):
+    # Returns the IDs of the queued jobs. Names sort by submission time,
+    # so workers take jobs first in, first out.
+    _ensure_dirs()
+    ids = []
+    for url in urls:
+        job_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        _write("pending", job_id + ".json", {
+            'id': job_id,
+            'url': canonical_url(url),
+            'content_type': content_type,
+            'force': force,
+            'attempts': 0,
+            'submitted_at': time.time()
+        })
+        ids.append(job_id)
+    return ids
+
+def queue_counts():
+    _ensure_dirs()
+    return {
+        state: len([name for name in os.listdir(_dir(state)) if name.endswith(".json")])
+        for state in STATES if state != "tmp"
+    }
+
+def _job_name(claim_name):
+    # The job's file name in pending/, done/ and failed/
+    return claim_name.partition("@")[0].removesuffix(".json") + ".json"
+
+def _claim(worker_id):
+    # Takes the oldest pending job. The mtime is set before the rename so
+    # the lease starts fresh; a worker that loses the race moves on.
+    for name in sorted(os.listdir(_dir("pending"))):
+        if not name.endswith(".json"):
+            continue
+        source = os.path.join(_dir("pending"), name)
+        target = os.path.join(_dir("claimed"), f"{name[:-len('.json')]}@{worker_id}-{uuid.uuid4().hex[:8]}.json")
+        try:
+            os.utime(source)
+            os.rename(source, target)
+            return _read(target), target
+        except FileNotFoundError:
+            continue
+    return None, None
+
+def _reclaim_expired(worker_id):
+    # Jobs whose worker stopped renewing the lease go back to pending, or
+    # to failed once they used up their attempts
+    now = time.time()
+    for name in os.listdir(_dir("claimed")):
+        path = os.path.join(_dir("claimed"), name)
+        try:
+            if now - os.stat(path).st_mtime < _settings["lease_seconds"]:
+                continue
+            # The rename decides which worker handles the expired lease
+            taken = os.path.join(_dir("tmp"), f"{name}.{worker_id}")
+            os.rename(path, taken)
+        except FileNotFoundError:
+            continue
+        record = _read(taken)
+        record['attempts'] = record.get('attempts', 0) + 1
+        if record['attempts'] >= _settings["max_attempts"]:
+            record['error'] = f"Lease expired {record['attempts']} times"
+            _write("failed", _job_name(name), record)
+            print_warning(f"{record['url']}: giving up after {record['attempts']} lost leases")
+        else:
+            _write("pending", _job_name(name), record)
+            print_warning(f"{record['url']}: lease expired, queued again")
+        os.remove(taken)
+
+def _finish(path, record, job, worker_id):
+    record.update(
+        status=job['status'],
+        error=job.get('error'),
+        format_id=job.get('format_id'),
+        worker=worker_id,
+        finished_at=time.time()
+    )
+    name = os.path.basename(path)
+    # Moving the claim away first means no other worker can reclaim the
+    # job while the result is written
+    taken = os.path.join(_dir("tmp"), name)
+    try:
+        os.rename(path, taken)
+    except FileNotFoundError:
+        # Another worker took the job over after our lease expired
+        print_warning(f"{record['url']}: lease was lost while the job ran")
+        return
+    _write("failed" if job['status'] == "failed" else "done", _job_name(name), record)
+    os.remove(taken)
+
+def _release(path):
+    # Hands an unfinished job straight back when the worker stops
+    try:
+        os.rename(path, os.path.join(_dir("pending"), _job_name(os.path.basename(path))))
+    except FileNotFoundError:
+        pass
+
+async def run_worker(
+        config,
+        extract_workers=4,
+        download_workers=2,
+        refresh=False,
+        postprocess_workers=None,
+        drain=False
+    ):
+    # Pulls jobs from the shared queue and runs them through the batch
+    # pipeline into the local download_path. With drain=True the worker
+    # exits once the queue is empty; otherwise it runs until Ctrl-C.
+    _ensure_dirs()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    slots = make_slots(extract_workers, download_workers, postprocess_workers)
+    capacity = download_workers + _settings["prefetch"]
+    running = {}
+    finished = {"done": 0, "failed": 0, "skipped": 0}
+    last_heartbeat = 0.0
+    print_success(f"Worker {worker_id} taking jobs from {_settings['path']}")
+
+    async def work(record):
+        job = new_job(record['url'], record['content_type'])
+        profile = config[record['content_type'].lower()]
+        if is_playlist_url(record['url']):
+            # Entries go back to the queue so every worker can take some
+            entries = []
+            try:
+                await expand_playlist(record['url'], entries.append)
+                enqueue(entries, record['content_type'], record.get('force', False))
+                job['status'] = "done"
+            except Exception as e:
+                job['status'] = "failed"
+                job['error'] = f"Could not list playlist: {e}"
+            return job
+        await run_job(job, profile, slots, refresh, record.get('force', False))
+        return job
+
+    try:
+        while True:
+            now = time.time()
+            if now - last_heartbeat >= _settings["heartbeat_seconds"]:
+                last_heartbeat = now
+                for path, (task, _) in running.items():
+                    try:
+                        os.utime(path)
+                    except FileNotFoundError:
+                        print_warning(f"Lost the lease on {os.path.basename(path)}, stopping it")
+                        task.cancel()
+                _reclaim_expired(worker_id)
+
+            while len(running) < capacity:
+                record, path = _claim(worker_id)
+                if record is None:
+                    break
+                running[path] = (asyncio.ensure_future(work(record)), record)
+
+            for path, (task, record) in list(running.items()):
+                if task.done():
+                    del running[path]
+                    if task.cancelled():
+                        continue
+                    try:
+                        job = task.result()
+                    except Exception as e:
+                        job = {'status': "failed", 'error': str(e)}
+                    finished[job['status']] = finished.get(job['status'], 0) + 1
+                    _finish(path, record, job, worker_id)
+
+            if drain and not running:
+                counts = queue_counts()
+                if counts["pending"] == 0 and counts["claimed"] == 0:
+                    break
+            await asyncio.sleep(_settings["poll_seconds"] if not running else 0.2)
+    finally:
+        for path, (task, _) in running.items():
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in running.values()), return_exceptions=True)
+        for path in running:
+            _release(path)
+    return finished